@@ -0,0 +1,244 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+# Stages import the pipeline scripts and funcs/ from the scripts folder
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import pandas as pd
+
+from benchmarks.synthetic import make_dataset
+
+ROOT_TERM = 'MONDO_0700096'
+STRONG = ['Definitive', 'Strong', 'Moderate']
+
+def _load_mondo(folder):
+    from funcs.ontologies import load_ontology
+    return load_ontology('file://' + os.path.abspath(os.path.join(folder, 'mondo.owl')), 'http://purl.obolibrary.org/obo/')
+
+def _clingen(folder):
+    from funcs.data import read_table
+    return read_table(os.path.join(folder, 'clingen.formatted'))
+
+# Each stage takes the synthetic data folder and returns (rows in, rows out)
+
+def stage_gtf_to_txt(folder):
+    from clingen_data_formatting import gtf_to_txt
+    genes = gtf_to_txt(os.path.join(folder, 'genes.gtf.gz'))
+    with open(os.path.join(folder, 'inputs.json')) as f:
+        return json.load(f)['gtf_lines'], len(genes)
+
+def stage_read_parquet_files(folder):
+    from funcs.data import read_parquet_files
+    opentargets = os.path.join(folder, 'opentargets')
+    studies = read_parquet_files(os.path.join(opentargets, 'study', 'study'), primary_filter_id='studyType', primary_filter=['gwas'],
+                                 columns=['studyId'])
+    loci = read_parquet_files(os.path.join(opentargets, 'credible_set', 'credible_set'), primary_filter_id='studyId',
+                              primary_filter=studies['studyId'], columns=['studyId', 'studyLocusId'])
+    l2g = read_parquet_files(os.path.join(opentargets, 'l2g_predictor', 'l2g_prediction'), columns=['studyLocusId', 'geneId', 'score'],
+                             secondary_filter_id='studyLocusId', secondary_filter=loci['studyLocusId'])
+    with open(os.path.join(folder, 'inputs.json')) as f:
+        return json.load(f)['opentargets']['l2g_prediction'], len(l2g)
+
+def stage_get_descendants(folder):
+    from funcs.ontologies import get_descendants
+    onto, namespace = _load_mondo(folder)
+    descendants = get_descendants(onto, namespace, ROOT_TERM)
+    return len(list(onto.classes())), len(descendants)
+
+def stage_closure_index(folder):
+    from funcs.ontology_index import build_closure_index, closure_descendants
+    onto, namespace = _load_mondo(folder)
+    closure = build_closure_index(onto)
+    children = closure_descendants(closure, ROOT_TERM, direct_only=True)
+    descendants = closure_descendants(closure, children['Ontology ID'])
+    return len(closure['terms']), len(descendants)
+
+def stage_get_protein_links(folder):
+    from protein_links import get_protein_links
+    clingen = _clingen(folder)
+    strong = clingen.loc[clingen['classification'].isin(STRONG)]
+    links = get_protein_links(os.path.join(folder, 'string.links.txt'), clingen, strong)
+    with open(os.path.join(folder, 'inputs.json')) as f:
+        return json.load(f)['string_links'], len(links)
+
+def stage_network_propagation(folder):
+    from funcs.data import read_string_links
+    from network_propagation import network_propagation_scores
+    clingen = _clingen(folder)
+    string = read_string_links(os.path.join(folder, 'string.links.txt'), channels=['experimental'])
+    scores = network_propagation_scores(string, clingen.loc[clingen['classification'].isin(STRONG)])
+    return len(string), len(scores)
+
+def stage_gwas_l2g_aggregation(folder):
+    from funcs.data import read_parquet_files
+    from funcs.general import group_unique
+    clingen = _clingen(folder)
+    l2g = read_parquet_files(os.path.join(folder, 'opentargets', 'l2g_predictor', 'l2g_prediction'), primary_filter=clingen['gene_id'],
+                             columns=['studyLocusId', 'geneId', 'score'])
+    l2g = l2g.rename(columns={'geneId': 'gene_id', 'studyLocusId': 'gwas_id_efo', 'score': 'l2g_score'})
+    l2g['gwas_label'] = l2g['gwas_id_efo'].str[:4]
+    merged = clingen.merge(l2g, on='gene_id', how='left')
+
+    keys = ['gene_id', 'gene_name', 'disease_label', 'mondo_disease_id', 'efo_ancestor_id', 'efo_ancestor_label']
+    features = group_unique(merged, keys, ['gwas_id_efo', 'gwas_label', 'l2g_score'])
+    return len(merged), len(features)
+
+def stage_mouse_aggregation(folder):
+    from funcs.data import read_parquet_files
+    from funcs.general import group_unique
+    clingen = _clingen(folder)
+    mouse = read_parquet_files(os.path.join(folder, 'opentargets', 'mouse_phenotype'), primary_filter_id='targetFromSourceId',
+                               primary_filter=clingen['gene_id'])
+    mouse = mouse.rename(columns={'targetFromSourceId': 'gene_id', 'modelPhenotypeId': 'mp_id', 'targetInModelEnsemblId': 'gene_id_mouse'})
+    mouse['mp_label'] = 'label ' + mouse['mp_id']
+    merged = mouse.merge(clingen, on='gene_id', how='right')
+
+    keys = ['gene_id', 'gene_name', 'disease_label', 'mondo_disease_id', 'gene_id_mouse', 'mondo_ancestor_id', 'ancestor_label']
+    features = group_unique(merged, keys, ['mp_id', 'mp_label'])
+    return len(merged), len(features)
+
+STAGES = {
+    'gtf_to_txt': stage_gtf_to_txt,
+    'read_parquet_files': stage_read_parquet_files,
+    'get_descendants': stage_get_descendants,
+    'closure_index': stage_closure_index,
+    'get_protein_links': stage_get_protein_links,
+    'network_propagation': stage_network_propagation,
+    'gwas_l2g_aggregation': stage_gwas_l2g_aggregation,
+    'mouse_aggregation': stage_mouse_aggregation,
+}
+
+def _measure(name, folder, queue):
+    '''
+    Run one stage and report its wall time, CPU time and peak RSS (of this process only).
+    '''
+    try:
+        start, cpu = time.perf_counter(), time.process_time()
+        rows_in, rows_out = STAGES[name](folder)
+        wall = time.perf_counter() - start
+        queue.put({
+            'wall_s': round(wall, 4),
+            'cpu_s': round(time.process_time() - cpu, 4),
+            # ru_maxrss is in KB on Linux and bytes on macOS
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1),
+            'rows_in': int(rows_in),
+            'rows_out': int(rows_out),
+            'rows_per_s': round(rows_in / wall, 1) if wall > 0 else None,
+        })
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+def run_stage(name, folder):
+    '''
+    Run a stage in a fresh process, so its peak memory is not hidden by earlier stages.
+    '''
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(name, folder, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def run_benchmarks(folder, stages=None, scale=1.0, repeats=1, regenerate=False, seed=0):
+    '''
+    Generate the synthetic inputs (unless they already exist for this scale) and time each stage.
+
+    With `repeats` > 1 the fastest run of each stage is kept.
+    '''
+    inputs_file = os.path.join(folder, 'inputs.json')
+    inputs = None
+    if os.path.exists(inputs_file) and not regenerate:
+        with open(inputs_file) as f:
+            inputs = json.load(f)
+    if inputs is None or inputs.get('scale') != scale or inputs.get('seed') != seed:
+        print(f"Generating synthetic inputs (scale {scale}) in {folder}")
+        inputs = {'scale': scale, 'seed': seed, **make_dataset(folder, scale=scale, seed=seed)}
+        with open(inputs_file, 'w') as f:
+            json.dump(inputs, f, indent=1)
+
+    results = {}
+    for name in stages or STAGES:
+        runs = [run_stage(name, folder) for _ in range(repeats)]
+        ok = [run for run in runs if 'error' not in run]
+        results[name] = min(ok, key=lambda run: run['wall_s']) if ok else runs[0]
+        print(f"[{name}] {results[name]}")
+
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'inputs': inputs,
+        'stages': results,
+    }
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    Compare stage wall times and peak memory with a baseline results file.
+
+    Returns a table of stages with their ratios to the baseline; a stage regressed
+    if either ratio exceeds 1 + `tolerance`.
+    '''
+    rows = []
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None or 'error' in stage or 'error' in base:
+            continue
+        rows.append({'stage': name,
+                     'wall_s': stage['wall_s'], 'baseline_wall_s': base['wall_s'],
+                     'wall_ratio': round(stage['wall_s'] / base['wall_s'], 2) if base['wall_s'] else None,
+                     'peak_rss_mb': stage['peak_rss_mb'], 'baseline_peak_rss_mb': base['peak_rss_mb'],
+                     'rss_ratio': round(stage['peak_rss_mb'] / base['peak_rss_mb'], 2) if base['peak_rss_mb'] else None})
+    table = pd.DataFrame(rows, columns=['stage', 'wall_s', 'baseline_wall_s', 'wall_ratio', 'peak_rss_mb', 'baseline_peak_rss_mb', 'rss_ratio'])
+    table['regression'] = (table['wall_ratio'] > 1 + tolerance) | (table['rss_ratio'] > 1 + tolerance)
+    if baseline.get('inputs', {}).get('scale') != results['inputs'].get('scale'):
+        print("Warning: baseline was run at a different scale")
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description='Time pipeline stages on synthetic inputs. Run from the repository root.')
+    parser.add_argument('stages', nargs='*', help='stages to run; default is all: ' + ', '.join(STAGES))
+    parser.add_argument('--scale', type=float, default=1.0, help='size of the synthetic inputs (1 is about 1M l2g rows)')
+    parser.add_argument('--data', default='data/benchmarks/synthetic', help='folder for the synthetic inputs')
+    parser.add_argument('--output', default='data/benchmarks/results.json', help='results file to write')
+    parser.add_argument('--baseline', default='data/benchmarks/baseline.json', help='baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='also save these results as the new baseline')
+    parser.add_argument('--repeats', type=int, default=1, help='runs per stage; the fastest is kept')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown or memory growth before a stage is a regression')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the synthetic inputs')
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}")
+
+    results = run_benchmarks(args.data, stages=args.stages, scale=args.scale, repeats=args.repeats, regenerate=args.regenerate)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results saved to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            table = compare(results, json.load(f), tolerance=args.tolerance)
+        print(table.to_string(index=False))
+        if table['regression'].any():
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
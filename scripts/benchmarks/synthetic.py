@@ -0,0 +1,210 @@
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+
+OBO = 'http://purl.obolibrary.org/obo/'
+CLASSIFICATIONS = ['Definitive', 'Strong', 'Moderate', 'Limited', 'Disputed', 'Refuted', 'No Known Disease Relationship']
+STRING_CHANNELS = ['neighborhood', 'fusion', 'cooccurence', 'coexpression', 'experimental', 'database', 'textmining', 'combined_score']
+
+def gene_ids(n):
+    return np.array([f'ENSG{i:011d}' for i in range(n)])
+
+def protein_ids(n):
+    return np.array([f'ENSP{i:011d}' for i in range(n)])
+
+def make_gtf(path, n_genes, transcripts_per_gene=3, protein_coding=0.6, seed=0):
+    '''
+    Write an Ensembl-style GTF (gzipped if `path` ends in .gz) with a gene line, and
+    transcript and exon lines for each transcript, for `n_genes` genes.
+
+    Returns the number of feature lines written.
+    '''
+    rng = np.random.default_rng(seed)
+    biotypes = np.where(rng.random(n_genes) < protein_coding, 'protein_coding', 'lncRNA')
+    chromosomes = rng.choice([str(c) for c in range(1, 23)] + ['X', 'Y', 'MT'], n_genes)
+    starts = rng.integers(1, 200_000_000, n_genes)
+    strands = rng.choice(['+', '-'], n_genes)
+
+    lines = 0
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as f:
+        f.write('#!genome-build GRCh38.p14\n#!genome-version GRCh38\n#!genome-date 2013-12\n'
+                '#!genome-build-accession GCA_000001405.29\n#!genebuild-last-updated 2024-07\n')
+        for i, gene in enumerate(gene_ids(n_genes)):
+            end = starts[i] + 20_000
+            gene_attributes = f'gene_id "{gene}"; gene_version "1"; gene_name "GENE{i}"; gene_source "ensembl_havana"; gene_biotype "{biotypes[i]}";'
+            f.write(f'{chromosomes[i]}\tensembl_havana\tgene\t{starts[i]}\t{end}\t.\t{strands[i]}\t.\t{gene_attributes}\n')
+            lines += 1
+            for t in range(transcripts_per_gene):
+                transcript = f' transcript_id "ENST{i:08d}{t:03d}"; transcript_biotype "{biotypes[i]}";'
+                f.write(f'{chromosomes[i]}\tensembl_havana\ttranscript\t{starts[i]}\t{end}\t.\t{strands[i]}\t.\t{gene_attributes}{transcript}\n')
+                f.write(f'{chromosomes[i]}\tensembl_havana\texon\t{starts[i]}\t{starts[i] + 500}\t.\t{strands[i]}\t.\t{gene_attributes}{transcript} exon_number "1";\n')
+                lines += 2
+    return lines
+
+def make_owl(path, n_terms, prefix='MONDO', root=700096, branching=4, extra_parents=0.1, version='2025-01-01', seed=0):
+    '''
+    Write an OWL (RDF/XML) is_a hierarchy of `n_terms` classes below a single root term,
+    e.g. MONDO_0700096 'human disease'. Each term is attached to a random earlier term
+    (about `branching` children per term), and a fraction `extra_parents` gets a second
+    parent so the hierarchy is a DAG rather than a tree.
+
+    Returns the list of term IDs, root first.
+    '''
+    rng = np.random.default_rng(seed)
+    terms = [f'{prefix}_{root:07d}'] + [f'{prefix}_{i:07d}' for i in range(1, n_terms)]
+
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0"?>\n'
+                '<rdf:RDF xmlns="http://purl.obolibrary.org/obo/"\n'
+                '     xmlns:owl="http://www.w3.org/2002/07/owl#"\n'
+                '     xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"\n'
+                '     xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">\n'
+                f'  <owl:Ontology rdf:about="{OBO}{prefix.lower()}.owl">\n'
+                f'    <owl:versionInfo>{version}</owl:versionInfo>\n'
+                '  </owl:Ontology>\n')
+        for i, term in enumerate(terms):
+            parents = []
+            if i > 0:
+                parents.append(terms[int(rng.integers(0, max(i // branching, 1)))])
+                if rng.random() < extra_parents and i > 1:
+                    parents.append(terms[int(rng.integers(0, i))])
+            f.write(f'  <owl:Class rdf:about="{OBO}{term}">\n')
+            for parent in dict.fromkeys(parents):
+                f.write(f'    <rdfs:subClassOf rdf:resource="{OBO}{parent}"/>\n')
+            f.write(f'    <rdfs:label>synthetic term {i}</rdfs:label>\n  </owl:Class>\n')
+        f.write('</rdf:RDF>\n')
+    return terms
+
+def make_string_links(path, n_proteins, links_per_protein=20, seed=0):
+    '''
+    Write a STRING detailed links file (space separated, taxon-prefixed protein IDs,
+    both directions of each link) between `n_proteins` proteins.
+
+    Returns the number of links written.
+    '''
+    rng = np.random.default_rng(seed)
+    n_links = n_proteins * links_per_protein // 2
+    protein1 = rng.integers(0, n_proteins, n_links)
+    protein2 = rng.integers(0, n_proteins, n_links)
+    keep = protein1 != protein2
+    protein1, protein2 = protein1[keep], protein2[keep]
+
+    proteins = np.char.add('9606.', protein_ids(n_proteins))
+    scores = {channel: np.where(rng.random(len(protein1)) < 0.7, 0, rng.integers(40, 1000, len(protein1)))
+              for channel in STRING_CHANNELS[:-1]}
+    scores['combined_score'] = np.maximum.reduce(list(scores.values()))
+
+    links = pd.DataFrame({'protein1': np.concatenate([proteins[protein1], proteins[protein2]]),
+                          'protein2': np.concatenate([proteins[protein2], proteins[protein1]]),
+                          **{channel: np.tile(values, 2) for channel, values in scores.items()}})
+    links.to_csv(path, sep=' ', index=False)
+    return len(links)
+
+def _write_parts(df, folder, n_parts=4, row_group_size=100_000):
+    os.makedirs(folder, exist_ok=True)
+    for i, part in enumerate(np.array_split(np.arange(len(df)), n_parts)):
+        df.iloc[part].to_parquet(os.path.join(folder, f'part-{i:05d}.parquet'), index=False, row_group_size=row_group_size)
+
+def make_opentargets(folder, n_genes, n_studies, loci_per_study=5, genes_per_locus=10, n_efo_terms=1000,
+                     mouse_phenotypes_per_gene=5, n_mp_terms=1000, seed=0):
+    '''
+    Write Open Targets-shaped parquet datasets under `folder`, laid out as in the download:
+    study/study, credible_set/credible_set, l2g_predictor/l2g_prediction and mouse_phenotype.
+
+    Returns a dict of dataset name -> number of rows.
+    '''
+    rng = np.random.default_rng(seed)
+    genes = gene_ids(n_genes)
+
+    studies = pd.DataFrame({'studyId': [f'GCST{i:08d}' for i in range(n_studies)],
+                            'studyType': rng.choice(['gwas', 'eqtl', 'pqtl'], n_studies, p=[0.5, 0.3, 0.2]),
+                            'pubmedId': [str(30000000 + i) for i in range(n_studies)],
+                            'diseaseIds': [[f'EFO_{i:07d}'] for i in rng.integers(0, n_efo_terms, n_studies)]})
+    _write_parts(studies, os.path.join(folder, 'study', 'study'))
+
+    credible_sets = pd.DataFrame({'studyId': np.repeat(studies['studyId'].to_numpy(), loci_per_study),
+                                  'studyLocusId': [f'{i:032x}' for i in range(n_studies * loci_per_study)]})
+    _write_parts(credible_sets, os.path.join(folder, 'credible_set', 'credible_set'))
+
+    n_l2g = len(credible_sets) * genes_per_locus
+    l2g = pd.DataFrame({'studyLocusId': np.repeat(credible_sets['studyLocusId'].to_numpy(), genes_per_locus),
+                        'geneId': genes[rng.integers(0, n_genes, n_l2g)],
+                        'score': rng.random(n_l2g)})
+    _write_parts(l2g, os.path.join(folder, 'l2g_predictor', 'l2g_prediction'))
+
+    n_mouse = n_genes * mouse_phenotypes_per_gene
+    mouse = pd.DataFrame({'targetFromSourceId': np.repeat(genes, mouse_phenotypes_per_gene),
+                          'modelPhenotypeId': [f'MP:{i:07d}' for i in rng.integers(0, n_mp_terms, n_mouse)],
+                          'targetInModelEnsemblId': [f'ENSMUSG{i:011d}' for i in np.repeat(np.arange(n_genes), mouse_phenotypes_per_gene)]})
+    _write_parts(mouse, os.path.join(folder, 'mouse_phenotype'))
+
+    return {'study': len(studies), 'credible_set': len(credible_sets), 'l2g_prediction': n_l2g, 'mouse_phenotype': n_mouse}
+
+def make_clingen(path, n_rows, n_genes, disease_ids, header_lines=4, seed=0):
+    '''
+    Write a ClinGen gene-disease validity summary CSV (with the download's preamble lines)
+    pairing random genes GENE<i> with random diseases from `disease_ids`.
+    '''
+    rng = np.random.default_rng(seed)
+    genes = rng.integers(0, n_genes, n_rows)
+    diseases = np.asarray(disease_ids)[rng.integers(0, len(disease_ids), n_rows)]
+    clingen = pd.DataFrame({'GENE SYMBOL': [f'GENE{i}' for i in genes],
+                            'GENE ID (HGNC)': [f'HGNC:{i}' for i in genes],
+                            'DISEASE LABEL': [f'disease {d}' for d in diseases],
+                            'DISEASE ID (MONDO)': np.char.replace(diseases.astype(str), '_', ':'),
+                            'MOI': 'AD',
+                            'SOP': 'SOP10',
+                            'CLASSIFICATION': rng.choice(CLASSIFICATIONS, n_rows)})
+    with open(path, 'w') as f:
+        f.write(''.join(f'synthetic preamble line {i}\n' for i in range(header_lines)))
+        clingen.to_csv(f, index=False)
+    return clingen
+
+def make_clingen_formatted(n_rows, n_genes, n_ancestors=30, seed=0):
+    '''
+    Build a table shaped like data/clingen.formatted (one row per gene, disease and mondo
+    ancestor) for the stages that start from the formatted ClinGen data.
+    '''
+    rng = np.random.default_rng(seed)
+    genes = rng.integers(0, n_genes, n_rows)
+    ancestors = rng.integers(0, n_ancestors, n_rows)
+    diseases = rng.integers(0, n_rows // 2 + 1, n_rows)
+    return pd.DataFrame({'gene_id': gene_ids(n_genes)[genes],
+                         'gene_name': [f'GENE{i}' for i in genes],
+                         'protein_id': protein_ids(n_genes)[genes],
+                         'mondo_disease_id': [f'MONDO_{i:07d}' for i in diseases],
+                         'disease_label': [f'disease {i}' for i in diseases],
+                         'mondo_ancestor_id': [f'MONDO_{i + 1:07d}' for i in ancestors],
+                         'ancestor_label': [f'synthetic term {i + 1}' for i in ancestors],
+                         'efo_ancestor_id': [f'EFO_{i:07d}' for i in ancestors],
+                         'efo_ancestor_label': [f'efo term {i}' for i in ancestors],
+                         'classification': rng.choice(CLASSIFICATIONS, n_rows)})
+
+def make_dataset(folder, scale=1.0, seed=0):
+    '''
+    Write every synthetic input under `folder`. At `scale` 1 there are 6,000 genes
+    (and proteins), 20,000 ontology terms, about 120,000 STRING links and 1,000,000 l2g
+    rows; sizes grow linearly with `scale`.
+
+    The formatted ClinGen table is written to '<folder>/clingen.formatted.parquet'.
+    Returns a dict of input name -> number of rows.
+    '''
+    os.makedirs(folder, exist_ok=True)
+    n_genes = max(int(6000 * scale), 100)
+    n_terms = max(int(20000 * scale), 100)
+
+    terms = make_owl(os.path.join(folder, 'mondo.owl'), n_terms, seed=seed)
+    clingen_formatted = make_clingen_formatted(max(int(5000 * scale), 100), n_genes, seed=seed)
+    clingen_formatted.to_parquet(os.path.join(folder, 'clingen.formatted.parquet'), index=False)
+    make_clingen(os.path.join(folder, 'clingen.csv'), len(clingen_formatted), n_genes, terms[1:], seed=seed)
+
+    return {
+        'gtf_lines': make_gtf(os.path.join(folder, 'genes.gtf.gz'), n_genes, seed=seed),
+        'ontology_terms': len(terms),
+        'string_links': make_string_links(os.path.join(folder, 'string.links.txt'), n_genes, seed=seed),
+        'opentargets': make_opentargets(os.path.join(folder, 'opentargets'), n_genes, max(int(20000 * scale), 10), seed=seed),
+        'clingen_rows': len(clingen_formatted),
+    }
@@ -2,7 +2,10 @@ import pandas as pd
 import os
 import re
 
-from funcs.ontologies import load_ontology, get_descendants
+from funcs.data import write_table
+from funcs.ontologies import load_ontology
+from funcs.ontology_index import get_closure_index, closure_descendants
+from funcs.profiling import export_profile, log_table, profiled, setup_logging
 
 def load_clingen_data(path):
     #Load data downloaded directly from ClinGen
@@ -17,47 +20,47 @@ def load_clingen_data(path):
 
     return clingen
 
-def parse_attributes(attribute):
-    # Regular expression to extract key-value pairs
-    pattern = re.compile(r'(\S+) "([^"]+)"')
-    matches = pattern.findall(attribute)
-    return {key: value for key, value in matches}
+def extract_attribute(attributes, key):
+    '''
+    Extract the value of one key from a column of GTF attribute strings,
+    e.g. gene_name from 'gene_id "ENSG00000141510"; gene_name "TP53";'.
+    Missing keys return NaN.
+    '''
+    return attributes.str.extract(f'(?:^|\\s){re.escape(key)} "([^"]*)"', expand=False)
 
-def gtf_to_txt(ensembl_data, chunksize = 10000):
+@profiled
+def gtf_to_txt(ensembl_data, chunksize = 500000, feature = 'gene', biotype = 'protein_coding', attributes = ('gene_id', 'gene_name')):
     """
     Convert Ensembl GTF data to a DataFrame with relevant columns.
-    Keep only protein-coding genes with a transcript support level of 1.
+    Keep only protein-coding genes.
+
+    The GTF is streamed in chunks and rows are filtered on the feature column and
+    gene_biotype before any attributes are parsed, so only the requested keys of
+    the remaining gene lines are extracted.
     """
     
     data_header = ['seqname', 'source', 'feature', 'start', 'end', 'score', 'strand', 'frame', 'attribute']
+    dtypes = {'seqname': str, 'feature': str, 'start': 'int64', 'end': 'int64', 'strand': str, 'attribute': str}
 
     processed_chunks = []
 
     # Read the Ensembl gene information in chunks
-    for chunk in pd.read_csv(ensembl_data, names=data_header, sep='\t', skiprows=5, chunksize=chunksize):
-        # Apply the function to the attribute column
-        attributes_df = chunk['attribute'].apply(parse_attributes).apply(pd.Series)
-        print(attributes_df, attributes_df)
-
-        # Merge the new columns with the original DataFrame
-        chunk = pd.concat([chunk, attributes_df], axis=1)
-        print(chunk, chunk.columns)
+    for chunk in pd.read_csv(ensembl_data, names=data_header, usecols=list(dtypes), dtype=dtypes,
+                             sep='\t', skiprows=5, chunksize=chunksize):
+        # Filter rows where feature is 'gene' and of the requested biotype
+        chunk = chunk.loc[chunk['feature'] == feature]
+        if biotype is not None:
+            chunk = chunk.loc[chunk['attribute'].str.contains(f'gene_biotype "{biotype}"', regex=False)]
 
-        # Filter rows where feature is 'gene'
-        chunk = chunk[chunk['feature'] == 'gene']
-        print(chunk, chunk.columns)
+        # Extract only the requested attributes
+        chunk = chunk.assign(**{key: extract_attribute(chunk['attribute'], key) for key in attributes})
 
-        # Select the specified columns
-        chunk = chunk[['seqname', 'start', 'end', 'strand', 'gene_id', 'gene_name', 'gene_biotype']]
-        chunk = chunk.loc[((chunk['gene_biotype'] == 'protein_coding'))]
-        chunk = chunk.drop(columns = ['gene_biotype'])
-        chunk = chunk.rename(columns = {'seqname':'chromosome'})
+        processed_chunks.append(chunk[['seqname', 'start', 'end', 'strand', *attributes]])
 
-        # Append the processed chunk to the list
-        processed_chunks.append(chunk)
-
-        # Concatenate all processed chunks
-        ensembl_info = pd.concat(processed_chunks, ignore_index=True)
+    # Concatenate all processed chunks once
+    ensembl_info = pd.concat(processed_chunks, ignore_index=True)
+    ensembl_info = ensembl_info.rename(columns = {'seqname':'chromosome'})
+    ensembl_info = ensembl_info.astype({'chromosome': 'category', 'start': 'int32', 'end': 'int32', 'strand': 'category'})
 
     return ensembl_info
 
@@ -102,27 +105,30 @@ def collate_ensembl_data(folder, prefix):
     # Load the Ensembl gene information
     ensembl_data = os.path.join(folder, f'{prefix}.gtf.gz')
     df = gtf_to_txt(ensembl_data)
-    print(df)
+    log_table('Ensembl genes', df)
 
     #Get proteins linked to the canonical transcript, and the associated uniprot (SWISSPROT) IDs
     uniprot_data = os.path.join(folder, f'{prefix}.uniprot.tsv')
     df = get_protein_information(uniprot_data, df)
-    print(df)
+    log_table('Ensembl genes with proteins', df)
 
     #Get entrez IDs of genes
     entrez_data = os.path.join(folder, f'{prefix}.entrez.tsv')
     df = get_entrez_ids(entrez_data, df)
-    print(df)
+    log_table('Ensembl genes with entrez IDs', df)
 
     df.drop_duplicates(keep = 'first', inplace=True)
 
     return df
 
+@profiled
 def get_mondo_descendants():
-    onto, mondo = load_ontology('http://purl.obolibrary.org/obo/mondo.owl','http://purl.obolibrary.org/obo/')
+    onto, mondo = load_ontology('http://purl.obolibrary.org/obo/mondo.owl','http://purl.obolibrary.org/obo/',
+                               cache_dir = 'data/ontology_lookups/snapshots')
+    closure = get_closure_index(onto)
 
     #get direct descendants of human disease
-    disease = get_descendants(mondo, 'MONDO_0700096', names = True, direct_only = True)
+    disease = closure_descendants(closure, 'MONDO_0700096', names = True, direct_only = True)
 
     #remove disease types unrelated to organ systems
     drop_terms = ['MONDO_0020683', #acute disease
@@ -146,26 +152,28 @@ def get_mondo_descendants():
                   'MONDO_0002254', #syndromic disease
                   ]
     disease = disease[~disease['Ontology ID'].isin(drop_terms)]
-    disease_descendants = []
-    for i, row in disease.iterrows():
-        descendants = get_descendants(mondo, row['Ontology ID'], names = True, direct_only= False)
-        descendants['mondo_ancestor_id'] = row['Ontology ID']
-        descendants['ancestor_label'] = row['Name']
-        disease_descendants.append(descendants)
-
-    disease_descendants = pd.concat(disease_descendants, ignore_index=True)
+    disease = disease.rename(columns = {'Ontology ID': 'mondo_ancestor_id',
+                                        'Name': 'ancestor_label'})
+
+    #all descendants of every organ system in a single closure lookup
+    disease_descendants = closure_descendants(closure, disease['mondo_ancestor_id'], names = True, direct_only = False)
     disease_descendants = disease_descendants.rename(columns = {'Ontology ID': 'mondo_disease_id',
-                                                                'Name': 'disease_label'})
+                                                                'Name': 'disease_label',
+                                                                'Ancestor': 'mondo_ancestor_id'})
+    disease_descendants = disease_descendants.merge(disease[['mondo_ancestor_id', 'ancestor_label']], on = 'mondo_ancestor_id', how = 'left')
     return disease_descendants[['mondo_disease_id', 'mondo_ancestor_id', 'ancestor_label']]
 
 def main():
     ###### change these file paths!!!! #########
     clingen = load_clingen_data('data/rawdata/Clingen-Gene-Disease-Summary-2025-08-20.csv')
-    print(clingen)
+    log_table('ClinGen', clingen)
     ensembl = collate_ensembl_data('data/rawdata/ensembl/', 'Homo_sapiens.GRCh38.114')
-    print(ensembl)
+    log_table('Ensembl', ensembl)
     ############################################
 
+    #all protein-coding genes, used as the gene axis of the genome-wide feature matrix
+    write_table(ensembl, 'data/ensembl.genes')
+
     #match clingen and ensembl
     clingen = clingen.merge(ensembl, on = 'gene_name', how = 'left')
 
@@ -180,10 +188,12 @@ def main():
     clingen.loc[clingen['classification'].isin(['Limited']), 'case/control'] = None
 
 
-    clingen.to_csv('data/clingen.formatted.txt', sep = '\t')
+    write_table(clingen, 'data/clingen.formatted', export_tsv = True)
 
     clingen[['mondo_ancestor_id', 'ancestor_label']].drop_duplicates(keep = 'first').to_csv('data/ontology_mapping.starter.txt', sep = '\t')
 
 if __name__ == "__main__":
+    setup_logging()
     main()
+    export_profile('data/profiles/clingen_data_formatting.json')
 
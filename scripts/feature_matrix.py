@@ -0,0 +1,236 @@
+import pandas as pd
+import numpy as np
+
+from funcs.data import read_ontology_mapping, read_table, write_table
+from funcs.general import explode_list_columns
+from funcs.ontologies import load_ontology
+from funcs.ontology_index import closure_descendants, get_closure_index
+from funcs.phenotype_profiles import build_profiles, count_hits, subtree_masks
+from funcs.profiling import export_profile, logger, profiled, setup_logging
+from funcs.similarity import information_content, set_similarity
+from mouse import get_opentargets_mouse
+
+GWAS_L2G_THRESHOLD = 0.5
+
+def matrix_axes(ensembl, clingen):
+    '''
+    Gene and ancestor axes of the feature matrix: every protein-coding gene in the Ensembl
+    table and every mondo_ancestor_id in the ClinGen table, each sorted.
+
+    Returns (genes, gene_names, ancestors, ancestor_labels) as pandas Index / numpy arrays.
+    '''
+    genes = ensembl[['gene_id', 'gene_name']].dropna(subset=['gene_id']).drop_duplicates(subset=['gene_id'])
+    genes = genes.sort_values('gene_id')
+    ancestors = clingen[['mondo_ancestor_id', 'ancestor_label']].dropna(subset=['mondo_ancestor_id'])
+    ancestors = ancestors.drop_duplicates(subset=['mondo_ancestor_id']).sort_values('mondo_ancestor_id')
+
+    return (pd.Index(genes['gene_id'].astype(str)), genes['gene_name'].astype(str).to_numpy(),
+            pd.Index(ancestors['mondo_ancestor_id'].astype(str)), ancestors['ancestor_label'].astype(str).to_numpy())
+
+def cell_index(genes, ancestors, gene_ids, ancestor_ids):
+    '''
+    Flat matrix position (gene code * number of ancestors + ancestor code) of each
+    (gene, ancestor) pair; -1 where either is not on the axes.
+    '''
+    gene_codes = genes.get_indexer(pd.Series(gene_ids).astype(str))
+    ancestor_codes = ancestors.get_indexer(pd.Series(ancestor_ids).astype(str))
+    return np.where((gene_codes >= 0) & (ancestor_codes >= 0), gene_codes * len(ancestors) + ancestor_codes, -1)
+
+def scatter_max(size, cells, values, fill=0, dtype=np.float32):
+    '''
+    Preallocated column of `size` cells holding the maximum of `values` per cell.
+    '''
+    column = np.full(size, fill, dtype=dtype)
+    values = np.asarray(values, dtype=dtype)
+    keep = (cells >= 0) & ~np.isnan(values) if np.issubdtype(dtype, np.floating) else cells >= 0
+    np.maximum.at(column, cells[keep], values[keep])
+    return column
+
+def scatter_count(size, cells, dtype=np.int32):
+    '''
+    Preallocated column of `size` cells holding the number of entries per cell.
+    '''
+    return np.bincount(cells[cells >= 0], minlength=size).astype(dtype)
+
+def ancestor_map(ontology_lookup, column):
+    '''
+    (ontology ancestor -> mondo_ancestor_id) pairs from the manual mapping file
+    (funcs.data.read_ontology_mapping), one row per ancestor in the `column` list.
+    '''
+    lookup = explode_list_columns(ontology_lookup[['mondo_ancestor_id', column]], [column])
+    return lookup.dropna(subset=['mondo_ancestor_id']).drop_duplicates()
+
+def mp_ancestor_terms(ontology_lookup, mp_closure):
+    '''
+    (mp_id -> mp_ancestor_id) pairs: every MP term under each MP ancestor in the manual
+    mapping file, from the MP closure index. Same pairs as mouse.get_ancestors, without
+    writing its per-ancestor lookup files.
+    '''
+    mp_ancestors = explode_list_columns(ontology_lookup[['mp_ancestor_id']], ['mp_ancestor_id'])['mp_ancestor_id'].unique()
+    mp_terms = closure_descendants(mp_closure, mp_ancestors, names=False)
+    return mp_terms.rename(columns={'Ontology ID': 'mp_id', 'Ancestor': 'mp_ancestor_id'})[['mp_id', 'mp_ancestor_id']]
+
+def clingen_labels(clingen, genes, ancestors):
+    '''
+    ClinGen label per cell: 1 if any gene-disease pair under the ancestor is a case,
+    0 if there are only controls, -1 if the gene has no labelled ClinGen curation there.
+    '''
+    size = len(genes) * len(ancestors)
+    labelled = clingen.loc[clingen['case/control'].isin(['case', 'control'])]
+    cells = cell_index(genes, ancestors, labelled['gene_id'], labelled['mondo_ancestor_id'])
+    label = scatter_max(size, cells, (labelled['case/control'] == 'case').astype(np.int8), fill=-1, dtype=np.int8)
+    return {'clingen_label': label}
+
+def gwas_features(l2g, efo_map, genes, ancestors):
+    '''
+    Maximum l2g score and number of GWAS loci with l2g score > 0.5 per cell, from the
+    genome-wide l2g table (data/opentargets_formatted/l2g) mapped to mondo ancestors.
+    '''
+    size = len(genes) * len(ancestors)
+    l2g = l2g[['gene_id', 'efo_ancestor_id', 'locus_id', 'l2g_score']].merge(efo_map, on='efo_ancestor_id', how='inner')
+    cells = cell_index(genes, ancestors, l2g['gene_id'], l2g['mondo_ancestor_id'])
+
+    loci = pd.DataFrame({'cell': cells, 'locus_id': l2g['locus_id'].to_numpy()})
+    loci = loci.loc[(l2g['l2g_score'].to_numpy() > GWAS_L2G_THRESHOLD) & (cells >= 0)].drop_duplicates()
+
+    gwas_loci = scatter_count(size, loci['cell'].to_numpy(), dtype=np.int16)
+    return {'l2g_max_score': scatter_max(size, cells, l2g['l2g_score']),
+            'gwas_loci': gwas_loci,
+            'gwas_association': gwas_loci > 0}
+
+def mouse_features(mouse, mp_map, genes, ancestors):
+    '''
+    Number of distinct mouse phenotypes under the cell's MP ancestors, from the output of
+    mouse.get_opentargets_mouse merged with mp_ancestor_terms.
+    '''
+    size = len(genes) * len(ancestors)
+    mouse = mouse[['gene_id', 'mp_id', 'mp_ancestor_id']].merge(mp_map, on='mp_ancestor_id', how='inner')
+    cells = cell_index(genes, ancestors, mouse['gene_id'], mouse['mondo_ancestor_id'])
+    phenotypes = pd.DataFrame({'cell': cells, 'mp_id': mouse['mp_id'].to_numpy()}).drop_duplicates()
+
+    mouse_phenotypes = scatter_count(size, phenotypes['cell'].to_numpy(), dtype=np.int32)
+    return {'mouse_phenotypes': mouse_phenotypes,
+            'mouse_phenotype': mouse_phenotypes > 0}
+
+def mouse_similarity_features(mouse, mp_map, mp_closure, genes, ancestors):
+    '''
+    Best-match-average Resnik similarity between each gene's mouse phenotypes and the
+    MP ancestor terms of each cell's organ system. Unlike mouse_phenotypes this also
+    credits phenotypes close to, but not under, the organ system's MP terms. IC is
+    estimated from the mouse phenotype annotations themselves.
+    '''
+    size = len(genes) * len(ancestors)
+    phenotypes = mouse[['gene_id', 'mp_id']].drop_duplicates()
+    ic = information_content(mp_closure, annotations=phenotypes['mp_id'])
+    scores = set_similarity(mp_closure, phenotypes, mp_map, 'gene_id', 'mondo_ancestor_id',
+                            term=('mp_id', 'mp_ancestor_id'), ic=ic, method='resnik', combine='bma')
+    cells = cell_index(genes, ancestors, scores['gene_id'], scores['mondo_ancestor_id'])
+    return {'mouse_similarity': scatter_max(size, cells, scores['similarity'])}
+
+def phenotype_term_features(annotations, term, closure, term_map, genes, ancestors, name):
+    '''
+    Number of phenotype terms, closed under ancestors, that a gene has inside each cell's
+    organ-system subtrees, e.g. MP phenotypes under the mp_ancestor_id terms mapped to
+    the mondo ancestor. Genes are packed into bit profiles over the ontology
+    (funcs.phenotype_profiles) and each count is a popcount against the organ system's
+    subtree mask.
+    '''
+    size = len(genes) * len(ancestors)
+    term_column = term_map.columns.drop('mondo_ancestor_id')[0]
+    profiles = build_profiles(closure, annotations, 'gene_id', term)
+
+    roots = term_map.groupby('mondo_ancestor_id')[term_column].unique()
+    counts = count_hits(profiles, subtree_masks(closure, roots.tolist()))
+
+    gene_ids = np.repeat(profiles['groups'], len(roots))
+    ancestor_ids = np.tile(roots.index.astype(str).to_numpy(), len(profiles['groups']))
+    cells = cell_index(genes, ancestors, gene_ids, ancestor_ids)
+    return {name: scatter_max(size, cells, counts.ravel(), dtype=np.int32)}
+
+def network_features(scores, ensembl, genes, ancestors):
+    '''
+    Highest network propagation score of any of the gene's proteins per cell, and whether
+    the gene was a seed for that ancestor, from data/features/network_propagation.all_proteins.
+    '''
+    size = len(genes) * len(ancestors)
+    proteins = ensembl[['protein_id', 'gene_id']].dropna().drop_duplicates(subset=['protein_id'])
+    protein_gene = pd.Series(proteins['gene_id'].astype(str).to_numpy(), index=proteins['protein_id'].astype(str).to_numpy())
+
+    gene_ids = protein_gene.reindex(scores['protein_id'].astype(str).to_numpy()).to_numpy()
+    cells = cell_index(genes, ancestors, gene_ids, scores['mondo_ancestor_id'])
+    return {'rwr_score': scatter_max(size, cells, scores['rwr_score']),
+            'network_seed': scatter_max(size, cells, scores['network_seed'], fill=False, dtype=bool)}
+
+def _repeat_categorical(values, codes):
+    '''
+    Categorical of values[codes] built from integer codes, without materialising the strings.
+    '''
+    values = pd.Categorical(values)
+    return pd.Categorical.from_codes(values.codes[codes], categories=values.categories)
+
+@profiled
+def build_feature_matrix(ensembl, clingen, ontology_lookup, l2g=None, mouse=None, network=None, mp_closure=None,
+                         hpo=None, hp_closure=None):
+    '''
+    Dense gene x mondo_ancestor_id feature table covering every protein-coding gene.
+
+    Rows are every (gene, ancestor) cell in gene-major order, with gene_id/gene_name and
+    mondo_ancestor_id/ancestor_label as categoricals whose codes are the matrix axes. Each
+    feature source is reduced straight into a preallocated column by its flat cell
+    index, so no source is merged onto the full matrix. Sources left as None are skipped.
+    mouse_similarity and mouse_phenotype_terms need the MP closure index (`mp_closure`)
+    as well as `mouse`; hp_phenotype_terms needs (gene_id, hp_id) annotations (`hpo`)
+    and the HP closure index (`hp_closure`).
+    '''
+    genes, gene_names, ancestors, ancestor_labels = matrix_axes(ensembl, clingen)
+    logger.info("Building feature matrix for %d genes x %d ancestors", len(genes), len(ancestors))
+
+    gene_codes = np.repeat(np.arange(len(genes), dtype=np.int32), len(ancestors))
+    ancestor_codes = np.tile(np.arange(len(ancestors), dtype=np.int32), len(genes))
+    columns = {
+        'gene_id': pd.Categorical.from_codes(gene_codes, categories=genes),
+        'gene_name': _repeat_categorical(gene_names, gene_codes),
+        'mondo_ancestor_id': pd.Categorical.from_codes(ancestor_codes, categories=ancestors),
+        'ancestor_label': _repeat_categorical(ancestor_labels, ancestor_codes),
+    }
+    columns.update(clingen_labels(clingen, genes, ancestors))
+
+    if l2g is not None:
+        columns.update(gwas_features(l2g, ancestor_map(ontology_lookup, 'efo_ancestor_id'), genes, ancestors))
+    if mouse is not None:
+        mp_map = ancestor_map(ontology_lookup, 'mp_ancestor_id')
+        columns.update(mouse_features(mouse, mp_map, genes, ancestors))
+        if mp_closure is not None:
+            columns.update(mouse_similarity_features(mouse, mp_map, mp_closure, genes, ancestors))
+            columns.update(phenotype_term_features(mouse, 'mp_id', mp_closure, mp_map, genes, ancestors, 'mouse_phenotype_terms'))
+    if hpo is not None and hp_closure is not None:
+        hp_map = ancestor_map(ontology_lookup, 'hp_phenotype_id')
+        columns.update(phenotype_term_features(hpo, 'hp_id', hp_closure, hp_map, genes, ancestors, 'hp_phenotype_terms'))
+    if network is not None:
+        columns.update(network_features(network, ensembl, genes, ancestors))
+
+    return pd.DataFrame(columns)
+
+def main():
+    ensembl = read_table('data/ensembl.genes')
+    clingen = read_table('data/clingen.formatted')
+    ontology_lookup = read_ontology_mapping()
+
+    l2g = read_table('data/opentargets_formatted/l2g', columns=['gene_id', 'efo_ancestor_id', 'locus_id', 'l2g_score'])
+    network = read_table('data/features/network_propagation.all_proteins')
+
+    onto, _ = load_ontology('http://purl.obolibrary.org/obo/mp/mp-international.owl', 'http://purl.obolibrary.org/obo/',
+                            cache_dir='data/ontology_lookups/snapshots')
+    mp_closure = get_closure_index(onto, prefix='obo.')
+    mouse = get_opentargets_mouse(gene_ids=ensembl['gene_id'])
+    mouse = mouse.merge(mp_ancestor_terms(ontology_lookup, mp_closure), on='mp_id', how='left')
+
+    #hp_phenotype_terms is left out until gene-HP annotations are part of the downloaded data
+    matrix = build_feature_matrix(ensembl, clingen, ontology_lookup, l2g=l2g, mouse=mouse, network=network, mp_closure=mp_closure)
+    write_table(matrix, 'data/features/feature_matrix')
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+    export_profile('data/profiles/feature_matrix.json')
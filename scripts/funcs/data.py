@@ -1,39 +1,202 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
+import hashlib
 import os
 
+from funcs.general import list_column
+from funcs.profiling import logger, profiled
+
+# Identifier and label columns stored as categoricals (dictionary encoded in parquet)
+CATEGORICAL_COLUMNS = ['gene_id', 'gene_name', 'protein_id', 'transcript_id', 'chromosome', 'strand',
+                       'mondo_disease_id', 'disease_label', 'classification', 'case/control',
+                       'mondo_ancestor_id', 'ancestor_label', 'efo_ancestor_id', 'efo_ancestor_label',
+                       'mp_ancestor_id', 'mp_ancestor_label', 'gene_id_mouse']
+
+# Columns of the manual ontology mapping that can hold several '; '-separated terms
+ONTOLOGY_LIST_COLUMNS = ['mp_ancestor_id', 'mp_ancestor_label', 'azphewas_label', 'opentargets_anatomicalsystem_label',
+                         'efo_ancestor_id', 'efo_ancestor_label', 'hp_phenotype_id', 'hp_phenotype_label']
+
+def write_table(df, path, export_tsv=False, categorical=CATEGORICAL_COLUMNS):
+    '''
+    Write an intermediate or feature table as parquet.
+
+    `path` is given without an extension ('data/clingen.formatted' is written to
+    'data/clingen.formatted.parquet'). Columns listed in `categorical` are stored as
+    categoricals so gene, disease and ancestor IDs are kept once per table. If
+    `export_tsv` is True a tab-separated copy is also written to '<path>.txt' for sharing.
+    The parquet file is written under a temporary name and moved into place, so a
+    script reading it in parallel never sees a partial table.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    categorical = [column for column in categorical if column in df.columns
+                   and not isinstance(df[column].dtype, pd.CategoricalDtype)]
+    df = df.astype({column: 'category' for column in categorical})
+
+    tmp = f'{path}.parquet.{os.getpid()}.tmp'
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, f'{path}.parquet')
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    if export_tsv:
+        df.to_csv(f'{path}.txt', sep='\t', index=False)
+
+def read_table(path, columns=None):
+    '''
+    Read a table written with write_table.
+
+    `path` is given without an extension. The parquet file is memory mapped and only
+    `columns` (default all) are read. If there is no parquet file, '<path>.txt' is read
+    as a tab-separated file instead, dropping the index column older files were saved with.
+    '''
+    if os.path.exists(f'{path}.parquet'):
+        return pq.read_table(f'{path}.parquet', columns=columns, memory_map=True).to_pandas()
+
+    df = pd.read_csv(f'{path}.txt', sep='\t')
+    df = df.drop(columns=[column for column in df.columns if column.startswith('Unnamed: ')])
+    return df[columns] if columns is not None else df
+
+def read_ontology_mapping(path='data/ontology_mapping.manualedits.txt', list_columns=ONTOLOGY_LIST_COLUMNS):
+    '''
+    Read the manual ontology mapping (one row per mondo_ancestor_id).
+
+    Multi-valued columns in `list_columns` are returned as Arrow list columns
+    (list<string>) rather than '; '-separated strings, with blank and 'nan' items
+    removed. Use funcs.general.explode_list_columns to get one row per term.
+    '''
+    df = pd.read_csv(path, sep='\t')
+    for column in list_columns:
+        if column in df.columns:
+            df[column] = list_column(df[column])
+    return df
+
+def _semi_join_filter(dataset, column, values):
+    '''
+    Filter expression keeping rows whose `column` is in `values` (a list, array, Series or set).
+
+    The key set is deduplicated and cast once to the column's Arrow type, so it is
+    matched as a typed hash set (against the dictionary values for dictionary-encoded
+    columns) rather than converted from Python objects for every batch. For orderable
+    types a min/max range test is added so row groups whose statistics fall outside
+    the key range are skipped without being decoded.
+    '''
+    field_type = dataset.schema.field(column).type
+    if pa.types.is_dictionary(field_type):
+        field_type = field_type.value_type
+
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        value_set = values
+    else:
+        value_set = pa.array(pd.unique(pd.Series(list(values) if isinstance(values, (set, frozenset)) else values).dropna()))
+    value_set = pc.unique(value_set.cast(field_type))
+    if isinstance(value_set, pa.ChunkedArray):
+        value_set = value_set.combine_chunks()
+
+    condition = ds.field(column).isin(value_set)
+    if len(value_set) and not pa.types.is_boolean(field_type) and not pa.types.is_nested(field_type):
+        bounds = pc.min_max(value_set)
+        condition = (ds.field(column) >= bounds['min']) & (ds.field(column) <= bounds['max']) & condition
+    return condition
+
+@profiled
 def read_parquet_files(folder, primary_filter = None, primary_filter_id='geneId', secondary_filter=None, secondary_filter_id='studyLocusId',
-                       tertiary_filter=None, tertiary_filter_id='isTransQtl'):
-    filtered_data = []
-    
-    # Build the filters for PyArrow
-    # The filter format is a list of tuples or a list of lists of tuples (for DNF).
-    pyarrow_filters = []
-    if primary_filter:
-        pyarrow_filters.append((primary_filter_id, 'in', primary_filter))
-    if secondary_filter:
-        pyarrow_filters.append((secondary_filter_id, 'in', secondary_filter))
-    if tertiary_filter:
-        pyarrow_filters.append((tertiary_filter_id, 'in', tertiary_filter))
-    # If no filters are provided, set filters to None
-    if not pyarrow_filters:
-        pyarrow_filters = None
-        
-    for file in os.listdir(folder):
-        if file.endswith('.parquet'):
-            print(f"Processing file: {file}")
-            filepath = os.path.join(folder, file)
-            try:
-                # Use pq.read_table() directly with the filepath and filters
-                table = pq.read_table(filepath, filters=pyarrow_filters)
-                df = table.to_pandas()
-                if not df.empty:
-                    filtered_data.append(df)
-            except Exception as e:
-                print(f"Error processing {file}: {e}")
-            # No need to manually delete objects; Python's garbage collector handles it.
-
-    if not filtered_data:
+                       tertiary_filter=None, tertiary_filter_id='isTransQtl', columns=None, use_threads=True):
+    '''
+    Read the parquet part files in a folder (e.g. an Open Targets dataset) into one DataFrame.
+
+    The folder is scanned as a single pyarrow dataset: only `columns` are read, the
+    filters are pushed down to the reader (row groups whose statistics cannot match
+    are skipped), part files are read in parallel, and the result is concatenated
+    at the Arrow level before a single conversion to pandas.
+
+    Each filter is a semi-join: it keeps rows whose `<filter>_id` column is in the given
+    values, which may be a list, numpy array, pandas Series, set or Arrow array with any
+    number of keys (e.g. every ClinGen gene or every GWAS studyLocusId). Rows are filtered
+    batch by batch during the scan, so rows that fail the filter are never converted to
+    pandas. A filter of None is not applied; an empty key set matches no rows.
+    Filter columns do not need to be included in `columns`.
+    '''
+    files = sorted(os.path.join(folder, file) for file in os.listdir(folder) if file.endswith('.parquet'))
+    if not files:
         return pd.DataFrame()
-    
-    return pd.concat(filtered_data, ignore_index=True)
+
+    logger.debug("Scanning %d files in %s", len(files), folder)
+    dataset = ds.dataset(files, format='parquet')
+
+    # Build the filter expression for PyArrow, one semi-join condition per filter
+    pyarrow_filters = None
+    for filter_id, filter_values in [(primary_filter_id, primary_filter),
+                                     (secondary_filter_id, secondary_filter),
+                                     (tertiary_filter_id, tertiary_filter)]:
+        if filter_values is not None:
+            condition = _semi_join_filter(dataset, filter_id, filter_values)
+            pyarrow_filters = condition if pyarrow_filters is None else pyarrow_filters & condition
+
+    table = dataset.to_table(columns=columns, filter=pyarrow_filters, use_threads=use_threads)
+
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def _string_links_key(path, protein_ids, channels, min_score):
+    '''
+    Fingerprint of a STRING file and the filters applied to it, stored with the cached edge list.
+    '''
+    stat = os.stat(path)
+    key = hashlib.sha1(f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{channels}|{min_score}'.encode())
+    if protein_ids is not None:
+        key.update('\n'.join(sorted(protein_ids)).encode())
+    return key.hexdigest()
+
+@profiled
+def read_string_links(path, protein_ids=None, channels=('experimental',), min_score=1, chunksize=1000000, cache=None):
+    '''
+    Stream a STRING protein links file (e.g. 9606.protein.links.detailed.v12.0.txt) into a compact edge list.
+
+    Only protein1, protein2 and the evidence `channels` are read. While streaming, links are
+    kept if any channel is >= `min_score` (use 0 to keep every link) and, if `protein_ids` is
+    given, if both proteins are in that set. The taxon prefix is removed from the protein IDs
+    ('9606.ENSP00000000233' -> 'ENSP00000000233') and protein1/protein2 are returned as
+    categoricals sharing one set of categories, so each ID is stored once and rows hold integer
+    codes. Channel scores are int16.
+
+    If `cache` is a parquet path, the filtered edge list is saved there and reused while the
+    STRING file and filters are unchanged; otherwise it is rebuilt and overwritten.
+    '''
+    channels = list(channels)
+    if protein_ids is not None:
+        protein_ids = pd.Index(pd.unique(pd.Series(protein_ids).dropna()))
+
+    key = _string_links_key(path, protein_ids, channels, min_score)
+    if cache is not None and os.path.exists(cache):
+        metadata = pq.read_schema(cache).metadata or {}
+        if metadata.get(b'string_links_key', b'').decode() == key:
+            logger.info("Loading filtered STRING links from %s", cache)
+            return pd.read_parquet(cache)
+
+    dtypes = {'protein1': str, 'protein2': str, **{channel: 'int16' for channel in channels}}
+    links = []
+    for chunk in pd.read_csv(path, sep=r'\s+', usecols=list(dtypes), dtype=dtypes, chunksize=chunksize):
+        chunk = chunk.loc[(chunk[channels] >= min_score).any(axis=1)]
+        chunk = chunk.assign(protein1=chunk['protein1'].str.split('.', n=1).str[1],
+                             protein2=chunk['protein2'].str.split('.', n=1).str[1])
+        if protein_ids is not None:
+            chunk = chunk.loc[chunk['protein1'].isin(protein_ids) & chunk['protein2'].isin(protein_ids)]
+        links.append(chunk)
+
+    links = pd.concat(links, ignore_index=True)[list(dtypes)]
+
+    # Encode both protein columns against one shared vocabulary
+    proteins = pd.Index(pd.unique(pd.concat([links['protein1'], links['protein2']]))).sort_values()
+    links['protein1'] = pd.Categorical(links['protein1'], categories=proteins)
+    links['protein2'] = pd.Categorical(links['protein2'], categories=proteins)
+
+    if cache is not None:
+        os.makedirs(os.path.dirname(cache) or '.', exist_ok=True)
+        table = pa.Table.from_pandas(links, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'string_links_key': key.encode()})
+        pq.write_table(table, cache)
+
+    return links
@@ -1,6 +1,12 @@
 import pandas as pd
-from funcs.general import sep_cells
+from funcs.general import explode_list_columns
+from funcs.data import read_string_links
+from funcs.profiling import log_table, profiled
 import ast
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
 
 def mondo_to_ontology(between_ontology_map, ontology_descendants, ontology_name):
     '''
@@ -10,7 +16,7 @@ def mondo_to_ontology(between_ontology_map, ontology_descendants, ontology_name)
         between_ontology_map[f'{ontology_name}_label'] = between_ontology_map['mondo_ancestor_id']
 
     between_ontology_map = between_ontology_map[['mondo_ancestor_id', f'{ontology_name}_label']]
-    between_ontology_map = sep_cells(between_ontology_map, f'{ontology_name}_label')
+    between_ontology_map = explode_list_columns(between_ontology_map, [f'{ontology_name}_label'])
     
     ontology_descendants = ontology_descendants.rename(columns = {'Ontology ID': f'{ontology_name}_id',
                                                                   'Ancestor': f'{ontology_name}_ancestor_id'})
@@ -66,55 +72,128 @@ def safe_eval(val):
     except (ValueError, SyntaxError):
         return []  # Return an empty list if parsing fails
     
-def read_and_explode_chembl(chembl_path):
-    chembl_df = pd.read_csv(chembl_path, converters={
-    "linkedDiseases.rows": safe_eval,
-    "linkedTargets.rows": safe_eval
-    })
-
-    # Explode the parsed list columns
-    chembl_df= chembl_df.explode("linkedDiseases.rows").explode("linkedTargets.rows").reset_index(drop=True)
-    chembl_df.dropna(subset = ['linkedDiseases.rows','linkedTargets.rows'], inplace=True)
-    chembl_df = chembl_df.sort_values(by = ['maximumClinicalTrialPhase'], ascending=False)
-    chembl_df = chembl_df.drop_duplicates(keep = 'first', subset = ['id','linkedDiseases.rows', 'linkedTargets.rows'])
-
-    chembl_df = chembl_df.rename(columns = {'id': 'drug_id','linkedDiseases.rows': 'ontology_id', 'linkedTargets.rows': 'gene_id', 'maximumClinicalTrialPhase': 'max_trial_phase'})
+def parse_list_column(column):
+    '''
+    Parse a string column of Python list literals ("['A', 'B']") with vectorized Arrow
+    string kernels instead of ast.literal_eval per cell.
+
+    Returns (flattened items, row index of each item). Missing, empty and unparsable
+    cells contribute no items, matching safe_eval. Items are assumed to be plain IDs
+    without commas or quotes.
+    '''
+    column = pc.utf8_trim(column.cast(pa.string()), characters=' []')
+    items = pc.split_pattern_regex(column, pattern=r'\s*,\s*')
+    values = pc.utf8_trim(items.flatten(), characters='\'" ')
+    keep = pc.not_equal(values, '')
+    return values.filter(keep), pc.list_parent_indices(items).filter(keep).to_numpy()
+
+def _cross_lists(diseases, disease_rows, targets, target_rows, n_rows):
+    '''
+    Every (row, disease, target) combination from two parsed list columns, i.e. the
+    result of exploding both columns, built directly from the flattened items.
+    '''
+    n_diseases = np.bincount(disease_rows, minlength=n_rows)
+    n_targets = np.bincount(target_rows, minlength=n_rows)
+    disease_start = np.concatenate([[0], np.cumsum(n_diseases)[:-1]])
+    target_start = np.concatenate([[0], np.cumsum(n_targets)[:-1]])
+
+    pairs = n_diseases * n_targets
+    row = np.repeat(np.arange(n_rows), pairs)
+    within = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+
+    disease = disease_start[row] + within // n_targets[row]
+    target = target_start[row] + within % n_targets[row]
+    return row, diseases.take(pa.array(disease)), targets.take(pa.array(target))
+
+@profiled
+def read_and_explode_chembl(chembl_path, block_size=1 << 26):
+    '''
+    Read the Open Targets ChEMBL export as one row per (drug, disease, target) with the
+    maximum clinical trial phase.
+
+    The CSV is streamed in blocks of `block_size` bytes. In each block the list columns are
+    parsed with Arrow and crossed per drug without exploding the frame, and the block is
+    reduced to the maximum phase per key before the next one is read.
+    '''
+    columns = ['id', 'linkedDiseases.rows', 'linkedTargets.rows', 'maximumClinicalTrialPhase']
+    reader = pv.open_csv(chembl_path, read_options=pv.ReadOptions(block_size=block_size),
+                         convert_options=pv.ConvertOptions(include_columns=columns,
+                                                           column_types={'id': pa.string(),
+                                                                         'linkedDiseases.rows': pa.string(),
+                                                                         'linkedTargets.rows': pa.string(),
+                                                                         'maximumClinicalTrialPhase': pa.float64()}))
+    reduced = []
+    for batch in reader:
+        diseases, disease_rows = parse_list_column(batch.column('linkedDiseases.rows'))
+        targets, target_rows = parse_list_column(batch.column('linkedTargets.rows'))
+        row, disease, target = _cross_lists(diseases, disease_rows, targets, target_rows, batch.num_rows)
+
+        block = pa.table({'drug_id': batch.column('id').take(pa.array(row)),
+                          'ontology_id': disease,
+                          'gene_id': target,
+                          'max_trial_phase': batch.column('maximumClinicalTrialPhase').take(pa.array(row))})
+        reduced.append(block.group_by(['drug_id', 'ontology_id', 'gene_id']).aggregate([('max_trial_phase', 'max')]))
+
+    if reduced:
+        chembl = pa.concat_tables(reduced).group_by(['drug_id', 'ontology_id', 'gene_id']).aggregate([('max_trial_phase_max', 'max')])
+        chembl_df = chembl.to_pandas().rename(columns = {'max_trial_phase_max_max': 'max_trial_phase'})
+    else:
+        chembl_df = pd.DataFrame(columns = ['drug_id', 'ontology_id', 'gene_id', 'max_trial_phase'])
+
+    chembl_df = chembl_df.sort_values(by = ['max_trial_phase'], ascending=False, kind='stable').reset_index(drop=True)
     chembl_df = chembl_df[['drug_id', 'ontology_id', 'gene_id', 'max_trial_phase']]
 
     return chembl_df
 
 def read_and_explode_opentargets(opentargets_path, column_name, ontology_map, gene_disease_data):
-    opentargets_df = pd.read_csv(opentargets_path, converters={
-        'organs': safe_eval})
-    
+    return read_opentargets_expression(opentargets_path, [column_name], ontology_map, gene_disease_data)[column_name]
+
+@profiled
+def read_opentargets_expression(opentargets_path, column_names, ontology_map, gene_disease_data):
+    '''
+    Top baseline expression value per (gene, disease) for several metrics at once.
+
+    The file is read, its 'organs' lists exploded and merged with the ontology map and
+    gene-disease data once; the row with the highest value of each metric in
+    `column_names` (e.g. ['rna.value', 'protein.level', 'rna.zscore']) is then picked
+    per (gene_id, mondo_disease_id) in a single grouped pass.
+
+    Returns a dict of metric -> DataFrame with the same columns as read_and_explode_opentargets.
+    '''
+    column_names = list(column_names)
+    table = pv.read_csv(opentargets_path, convert_options=pv.ConvertOptions(include_columns=['id', 'organs'] + column_names,
+                                                                            column_types={'id': pa.string(), 'organs': pa.string()}))
+
     # Explode the 'organs' column
-    opentargets_df = opentargets_df.explode("organs").reset_index(drop=True)
-    opentargets_df.dropna(subset = ['organs'], inplace=True)
-    opentargets_df = opentargets_df.sort_values(by = [column_name], ascending=False)
-    
+    organs, rows = parse_list_column(table.column('organs').combine_chunks())
+    opentargets_df = table.drop_columns(['organs']).take(pa.array(rows)).append_column('organs', organs).to_pandas()
+
     opentargets_df.rename(columns = {'id': 'gene_id', 'organs': 'opentargets_label'}, inplace=True)
-    
-    ontology_map = sep_cells(ontology_map, 'opentargets_label')
+
+    ontology_map = explode_list_columns(ontology_map, ['opentargets_label'])
 
     opentargets_df = opentargets_df.merge(ontology_map, on = ['opentargets_label'], how = 'left')
-    
+    opentargets_df = opentargets_df[['gene_id', 'opentargets_label', 'mondo_ancestor_id'] + column_names]
 
-    opentargets_df = opentargets_df[['gene_id', 'opentargets_label', 'mondo_ancestor_id', column_name]]
-    
     opentargets_df = gene_disease_data.merge(opentargets_df, on = ['gene_id', 'mondo_ancestor_id'], how = 'inner')
-    
-    opentargets_df = opentargets_df.sort_values(by = [column_name], ascending=False)
-    opentargets_df = opentargets_df.drop_duplicates(keep = 'first', subset = ['gene_id','mondo_disease_id'])
+    opentargets_df = opentargets_df.reset_index(drop=True)
 
-    opentargets_df = opentargets_df[['gene_name', 'gene_id', 'mondo_disease_id', 'mondo_ancestor_id', 'opentargets_label', column_name]]
+    #row of the highest value of each metric per gene-disease pair (groups with only missing values keep their first row)
+    top = opentargets_df[column_names].astype(float).fillna(-np.inf)
+    top = top.groupby([opentargets_df['gene_id'], opentargets_df['mondo_disease_id']], sort=False).idxmax()
 
-    return opentargets_df
+    columns = ['gene_name', 'gene_id', 'mondo_disease_id', 'mondo_ancestor_id', 'opentargets_label']
+    expression = {}
+    for column_name in column_names:
+        metric_df = opentargets_df.loc[top[column_name], columns + [column_name]]
+        metric_df = metric_df.sort_values(by = [column_name], ascending=False)
+        expression[column_name] = metric_df.reset_index(drop=True)
 
-def format_protein_data(protein_path, gene_disease_data):
-    protein_df = pd.read_csv(protein_path, sep = '\s+')
+    return expression
 
-    protein_df.loc[:,'protein1'] = protein_df['protein1'].str.split('.').str[1]
-    protein_df.loc[:,'protein2'] = protein_df['protein2'].str.split('.').str[1]
+def format_protein_data(protein_path, gene_disease_data):
+    #keep links with any experimental score (including 0) between proteins in the gene-disease data
+    protein_df = read_string_links(protein_path, protein_ids = gene_disease_data['protein_id'], channels = ['experimental'], min_score = 0)
 
     protein_df = protein_df.rename(columns = {'protein1': 'linked_protein_id', 'protein2': 'protein_id'})
 
@@ -137,7 +216,7 @@ def format_protein_data(protein_path, gene_disease_data):
     link_count = link_count[['gene_name', 'gene_id', 'mondo_disease_id', 'mondo_ancestor_id', 'linked_protein_id','protein_id', 'experimental']].drop_duplicates(keep = 'first')
 
     #count number is wrong
-    print(link_count)
+    log_table('Protein link counts', link_count)
 
     return score, link_count
     
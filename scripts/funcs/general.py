@@ -1,13 +1,136 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from funcs.profiling import profiled
+
+def _to_arrow(values):
+    """
+    Arrow array of a pandas Series / array, without a copy if it is already Arrow backed.
+    """
+    if not isinstance(values, (pa.Array, pa.ChunkedArray)):
+        series = pd.Series(values)
+        values = pa.array(series.array if isinstance(series.dtype, pd.ArrowDtype) else series, from_pandas=True)
+    return values.combine_chunks() if isinstance(values, pa.ChunkedArray) else values
+
+def split_list_column(values, sep = '; '):
+    """
+    Split `sep`-delimited strings (e.g. 'MP_0005377; MP_0005389') into an Arrow list column.
+
+    Items are stripped of whitespace and empty or 'nan' items (from trailing separators
+    or missing values written out as text) are dropped. Missing cells become empty lists.
+    Returns a list<string> array; wrap it with pd.ArrowDtype to keep it in a DataFrame.
+    """
+    values = _to_arrow(values)
+    if pa.types.is_list(values.type) or pa.types.is_large_list(values.type):
+        return values
+    if not pa.types.is_string(values.type):
+        values = values.cast(pa.string())
+
+    lists = pc.split_pattern(values.fill_null(''), pattern=sep)
+    items = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    keep = pc.and_(pc.not_equal(items, ''), pc.not_equal(pc.utf8_lower(items), 'nan')).to_numpy(zero_copy_only=False)
+
+    parents = pc.list_parent_indices(lists).to_numpy()[keep]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(parents, minlength=len(values)))]).astype(np.int32)
+    return pa.ListArray.from_arrays(offsets, items.filter(pa.array(keep)))
+
+def list_column(values, sep = '; '):
+    """
+    `sep`-delimited strings as a pandas Series of Arrow lists (list<string>).
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    lists = split_list_column(values, sep=sep)
+    return pd.Series(lists, index=index, dtype=pd.ArrowDtype(lists.type), name=getattr(values, 'name', None))
+
+def join_list_column(values, sep = '; '):
+    """
+    Join an Arrow list column back into `sep`-delimited strings (empty lists become missing).
+    """
+    lists = split_list_column(values, sep=sep)
+    joined = pc.if_else(pc.greater(pc.list_value_length(lists), 0), pc.binary_join(lists, sep), None)
+    return pd.Series(joined.to_pandas(), index=values.index if isinstance(values, pd.Series) else None)
+
+def explode_list_columns(df, columns, sep = '; ', keep_empty = False):
+    """
+    One row per item of the list columns in `columns`, with the other columns repeated.
+
+    Columns can be Arrow list columns or `sep`-delimited strings, which are split with
+    split_list_column. The first column sets the number of rows: the others are aligned
+    to it by position (like zipping 'MP_0005377; MP_0005389' with the matching labels),
+    and are missing where they have fewer items. Rows whose first column has no items
+    (or a null list, e.g. from a left merge) are dropped, unless `keep_empty` is True,
+    in which case they are kept once with the exploded columns missing. Missing values
+    in other columns never drop a row.
+
+    Splitting, flattening and the row gather are Arrow / numpy kernels, so no
+    per-row Python lists are built.
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    lists = [split_list_column(df[column], sep=sep) for column in columns]
+
+    #null list cells (e.g. from a left merge) have no items
+    lengths = pc.fill_null(pc.list_value_length(lists[0]), 0).to_numpy(zero_copy_only=False)
+    repeats = np.maximum(lengths, 1) if keep_empty else lengths
+    rows = np.repeat(np.arange(len(df)), repeats)
+    position = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+
+    result = df.drop(columns=columns).iloc[rows].reset_index(drop=True)
+    for column, values in zip(columns, lists):
+        offsets = values.offsets.to_numpy()[:-1] - values.offsets[0].as_py()
+        valid = position < pc.fill_null(pc.list_value_length(values), 0).to_numpy(zero_copy_only=False)[rows]
+        items = pc.list_flatten(values).take(pa.array(offsets[rows] + position, mask=~valid))
+        result[column] = items.to_pandas()
+    return result[list(df.columns)]
 
 def sep_cells(df, column, sep = '; '):
     """
-    Separate cells in a dataframe column by a separator
+    Separate cells in a dataframe column by a separator, one row per item.
+
+    Only rows without any item in `column` are dropped; missing values in other
+    columns are kept. See explode_list_columns.
+    """
+    return explode_list_columns(df, [column], sep=sep)
+
+@profiled
+def group_unique(df, keys, columns, sep = ';', as_list = ()):
+    """
+    Group by `keys` and collect the unique non-missing values of each of `columns`,
+    in order of first appearance.
+
+    Equivalent to
+    df.groupby(keys, observed=True).agg(col=(col, lambda x: sep.join(map(str, x.dropna().unique()))))
+    but without a Python call per group: rows are coded by group (categorical and
+    integer keys are used as is), (group, value) pairs are deduplicated and sorted once,
+    and the values are cut into one Arrow list per group from the segment offsets.
+
+    Columns in `as_list` are returned as Arrow list columns of their original values
+    (e.g. l2g scores as list<double>) instead of joined strings. Rows with a missing key
+    are dropped and groups are sorted, as in groupby.
     """
-    df = df.copy()
-    df.loc[:,column] = df[column].str.split(sep)
-    df = df.explode(column)
-    #drop na values
-    df = df.dropna()
-    
-    return df
\ No newline at end of file
+    group = df.groupby(keys, observed=True, sort=True).ngroup().fillna(-1).to_numpy(np.int64)
+    n_groups = int(group.max()) + 1 if len(group) else 0
+    first = np.full(n_groups, len(group))
+    np.minimum.at(first, group[group >= 0], np.flatnonzero(group >= 0))
+
+    result = df[keys].iloc[first].reset_index(drop=True)
+    for column in columns:
+        codes, uniques = pd.factorize(df[column])
+        valid = (group >= 0) & (codes >= 0)
+
+        #first appearance of each (group, value) pair, ordered by group then appearance
+        n_values = max(len(uniques), 1)
+        pairs, position = np.unique(group[valid] * n_values + codes[valid], return_index=True)
+        pairs = pairs[np.lexsort((position, pairs // n_values))]
+        value_group, value_codes = pairs // n_values, pairs % n_values
+
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(value_group, minlength=n_groups))]).astype(np.int32)
+        if column in as_list:
+            values = pa.array(np.asarray(uniques)[value_codes])
+            result[column] = pd.Series(pa.ListArray.from_arrays(offsets, values), dtype=pd.ArrowDtype(pa.list_(values.type)))
+        else:
+            values = pa.array(pd.Index(uniques).astype(str).to_numpy(dtype=object)[value_codes], type=pa.string())
+            result[column] = pc.binary_join(pa.ListArray.from_arrays(offsets, values), sep).to_numpy(zero_copy_only=False)
+
+    return result
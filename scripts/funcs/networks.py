@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from funcs.profiling import profiled
+
+def incidence_matrix(df, row, column):
+    """
+    Build a binary sparse incidence matrix from two columns of a table, e.g. diseases
+    (`row` = 'mondo_disease_id') x organ systems (`column` = 'ancestor_label').
+
+    Duplicate pairs count once and rows with either value missing are ignored.
+
+    Returns (rows x columns scipy CSR matrix of 0/1, row labels, column labels), with
+    labels sorted.
+    """
+    pairs = df[[row, column]].dropna().astype(str).drop_duplicates()
+    row_labels = pd.Index(pairs[row].unique()).sort_values()
+    column_labels = pd.Index(pairs[column].unique()).sort_values()
+
+    rows = row_labels.get_indexer(pairs[row])
+    cols = column_labels.get_indexer(pairs[column])
+    data = np.ones(len(pairs), dtype=np.int32)
+    incidence = sp.csr_matrix((data, (rows, cols)), shape=(len(row_labels), len(column_labels)))
+    return incidence, row_labels, column_labels
+
+def co_occurrence(incidence, labels, min_count=1):
+    """
+    Pairwise co-occurrence of the columns of an incidence matrix, as an edge list.
+
+    All pair counts come from one sparse product (B^T B): the diagonal is how many rows
+    each column has, the upper triangle how many rows each pair shares.
+
+    Returns a DataFrame with one row per pair sharing at least `min_count` rows:
+    source, target, count, source_count, target_count, jaccard
+    (count / rows with either) and log_weight (log(count + 1)).
+    """
+    counts = (incidence.T @ incidence).tocsr()
+    totals = counts.diagonal()
+
+    shared = sp.triu(counts, k=1).tocoo()
+    keep = shared.data >= min_count
+    source, target, count = shared.row[keep], shared.col[keep], shared.data[keep].astype(np.int64)
+
+    edges = pd.DataFrame({'source': np.asarray(labels)[source],
+                          'target': np.asarray(labels)[target],
+                          'count': count,
+                          'source_count': totals[source],
+                          'target_count': totals[target]})
+    edges['jaccard'] = count / (totals[source] + totals[target] - count)
+    edges['log_weight'] = np.log(count + 1)
+    return edges.sort_values(['count', 'source', 'target'], ascending=[False, True, True], ignore_index=True)
+
+@profiled
+def ancestor_network(gene_disease_data, by='mondo_disease_id', ancestor='ancestor_label', min_count=1):
+    """
+    Organ-system co-occurrence network: ancestors are linked by the number of `by`
+    values (diseases, or 'gene_id' for genes) they share in the gene-disease data
+    (e.g. clingen.formatted).
+
+    Returns the co_occurrence edge list.
+    """
+    incidence, _, ancestors = incidence_matrix(gene_disease_data, by, ancestor)
+    return co_occurrence(incidence, ancestors, min_count=min_count)
+
+def to_networkx(edges, weight='log_weight'):
+    """
+    Undirected networkx graph of an edge list from co_occurrence, with every edge
+    column as an edge attribute and `weight` also stored as 'weight'.
+
+    networkx is only needed for this function.
+    """
+    import networkx as nx
+
+    edges = edges.assign(weight=edges[weight])
+    return nx.from_pandas_edgelist(edges, 'source', 'target', edge_attr=True)
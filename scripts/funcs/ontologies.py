@@ -1,7 +1,64 @@
 from owlready2 import *
 import pandas as pd
+import fcntl
+import os
+import re
 
-def load_ontology(ontology, namespace):
+from funcs.ontology_index import annotation_values, relation_subjects, terms_from_labels
+from funcs.profiling import logger
+
+#persistent worlds opened by load_ontology, keyed by snapshot path
+_snapshot_worlds = {}
+
+def _snapshot_path(ontology, cache_dir, version=None):
+    """
+    Build the snapshot file path for an ontology IRI and release version.
+    """
+    name = re.sub(r'[^\w.-]+', '_', ontology.split('://')[-1]).strip('_')
+    version = re.sub(r'[^\w.-]+', '_', str(version)) if version else 'latest'
+    return os.path.join(cache_dir, f'{name}.{version}.sqlite3')
+
+def _open_snapshot(ontology, namespace, path, refresh=False):
+    """
+    Open (building it first if needed) the SQLite snapshot of an ontology at `path`.
+
+    owlready2 writes to the quadstore while it opens and loads it, so a lock file next
+    to the snapshot lets only one script running in parallel do this at a time, and the
+    others wait rather than deadlock on the database. New snapshots are saved to a
+    temporary file and moved into place, so one is never read half written.
+
+    Returns the world, ontology and namespace, and whether the snapshot was built.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if refresh and os.path.exists(path):
+            os.remove(path)
+
+        built = not os.path.exists(path)
+        if built:
+            tmp = f'{path}.{os.getpid()}.tmp'
+            world = World(filename=tmp)
+            try:
+                world.get_ontology(ontology).load()
+                world.save()
+                world.close()
+                os.replace(tmp, path)
+            except BaseException:
+                world.close()
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+        world = World(filename=path, exclusive=False)
+        onto = world.get_ontology(ontology)
+        #the quadstore already holds the ontology, so load() does not fetch it again
+        onto.load()
+        namespace = world.get_namespace(namespace)
+        world.save()
+    return world, onto, namespace, built
+
+def load_ontology(ontology, namespace, cache_dir=None, version=None, refresh=False):
     """
     Load an ontology and retrieve its associated namespace.
 
@@ -9,7 +66,12 @@ def load_ontology(ontology, namespace):
     (e.g., file path, URL, or ontology IRI) and retrieves a 
     corresponding namespace object for working with its terms.
     If the ontology has already been loaded, it will not reload
-    it, but will print a message indicating that status.
+    it, but will log a message indicating that status.
+
+    If `cache_dir` is given, the ontology is kept in a persistent owlready2
+    SQLite world keyed by its IRI and release `version`. The first run
+    downloads and parses the ontology and saves the quadstore; later runs open
+    the snapshot directly, without network access or re-parsing.
 
     Parameters
     ----------
@@ -19,6 +81,16 @@ def load_ontology(ontology, namespace):
     namespace : str
         Namespace IRI (or prefix) within the ontology to work with.
         Passed to `get_namespace()` from owlready2.
+    cache_dir : str or None, optional
+        Folder holding ontology snapshots. If None (default), the ontology is
+        loaded into the in-memory default world, as before.
+    version : str or None, optional
+        Release version used to key the snapshot (e.g. `'3.81.0'`). Defaults to
+        `'latest'`. Requesting a new version creates a new snapshot rather than
+        reusing an older release.
+    refresh : bool, optional
+        If True, delete any existing snapshot for this IRI and version and
+        reload the ontology from source. Default is False.
 
     Returns
     -------
@@ -43,6 +115,11 @@ def load_ontology(ontology, namespace):
     - The `get_namespace()` call does not depend on whether the ontology was 
       preloaded; it is executed regardless.
     - This function validates that the namespace exists before returning.
+    - Snapshots are never invalidated automatically: an unversioned IRI such
+      as the MONDO purl stays at the cached release until `refresh=True` or a
+      new `version` is requested.
+    - Scripts running in parallel (e.g. pipeline steps) can share a snapshot:
+      building and opening it is serialised by a `<snapshot>.lock` file.
 
     Examples
     --------
@@ -57,19 +134,44 @@ def load_ontology(ontology, namespace):
     ...     "http://purl.obolibrary.org/obo/go#"
     ... )
     Ontology is already loaded.
-    """
-    onto = get_ontology(ontology)
-    namespace = get_namespace(namespace)
 
-    if onto.loaded:
-        print("Ontology is already loaded.")
+    >>> onto, ns = load_ontology(
+    ...     "http://www.ebi.ac.uk/efo/releases/v3.81.0/efo.owl",
+    ...     "http://www.ebi.ac.uk/efo/",
+    ...     cache_dir="data/ontology_lookups/snapshots",
+    ...     version="3.81.0"
+    ... )
+    Ontology snapshot loaded from data/ontology_lookups/snapshots/www.ebi.ac.uk_efo_releases_v3.81.0_efo.owl.3.81.0.sqlite3
+    """
+    if cache_dir is None:
+        onto = default_world.get_ontology(ontology)
+        namespace = default_world.get_namespace(namespace)
+        if onto.loaded:
+            logger.info("Ontology is already loaded.")
+        else:
+            onto.load()
+            logger.info("Ontology was not loaded. Now loaded.")
+        return onto, namespace
+
+    path = _snapshot_path(ontology, cache_dir, version)
+    if refresh and path in _snapshot_worlds:
+        _snapshot_worlds.pop(path).close()
+    if path in _snapshot_worlds:
+        world = _snapshot_worlds[path]
+        onto = world.get_ontology(ontology)
+        namespace = world.get_namespace(namespace)
+        logger.info("Ontology is already loaded.")
+        return onto, namespace
+
+    world, onto, namespace, built = _open_snapshot(ontology, namespace, path, refresh=refresh)
+    _snapshot_worlds[path] = world
+    if built:
+        logger.info("Ontology was not loaded. Now loaded and saved to %s", path)
     else:
-        onto.load()
-        print("Ontology was not loaded. Now loaded.")
-
+        logger.info("Ontology snapshot loaded from %s", path)
     return onto, namespace
 
-def get_term_from_label(namespace, label, ontology, prefix='obo.'):
+def get_term_from_label(namespace, label, ontology, prefix='obo.', index=None):
     """
     Retrieve one or more ontology term identifiers from a human-readable label.
 
@@ -93,6 +195,10 @@ def get_term_from_label(namespace, label, ontology, prefix='obo.'):
     prefix : str, optional
         A common IRI prefix to strip from the result identifier.
         Defaults to `'obo.'`.
+    index : pandas.DataFrame, optional
+        Label index from `build_label_index`. If given, the label is looked up
+        in the index (labels, exact synonyms and obsolete-term replacements)
+        instead of searching the namespace.
 
     Returns
     -------
@@ -106,6 +212,7 @@ def get_term_from_label(namespace, label, ontology, prefix='obo.'):
     - The search is performed using `namespace.search(label=...)` and then
       filtered to ensure exact match ignoring case.
     - Multiple terms may share the same label, so all matches are returned.
+    - To resolve many labels, build the index once and use `terms_from_labels`.
     - Prefix stripping assumes the term's string representation contains
       `"obo.TERMID"` or `"ONTOLOGY.TERMID"`. Adjust logic if IRIs differ.
 
@@ -121,6 +228,11 @@ def get_term_from_label(namespace, label, ontology, prefix='obo.'):
     >>> get_term_from_label(ns, "Nonexistent Term", "GO")
     []
     """
+    if index is not None:
+        matches = terms_from_labels(index, [label])
+        ids = matches['term_id'].dropna().str.replace(f"{ontology}.", '', regex=False)
+        return list(ids.drop_duplicates())
+
     results = namespace.search(label=label)  # Initial search
     
     # Also attempt case-insensitive match
@@ -193,7 +305,7 @@ def get_descendants(onto, namespace, entity_id, alternate_iri = None, names=True
         entity = onto.search_one(iri=f'{alternate_iri}{entity_id}')
     else:
         entity = namespace[entity_id]
-    print(entity, entity_id)
+    logger.debug('Descendants of %s (%s)', entity, entity_id)
 
     seen = set()
     descendants = []
@@ -273,7 +385,7 @@ def get_all_ancestors(namespace, entity, prefix='obo.'):
 
 def invert_part_of(onto, namespace, entity, 
                    part_of='http://purl.obolibrary.org/obo/BFO_0000050', 
-                   prefix='obo.'):
+                   prefix='obo.', index=None):
     """
     Retrieve all ontology classes that contain the given entity via a 'part_of' relation.
 
@@ -295,6 +407,9 @@ def invert_part_of(onto, namespace, entity,
         BFO 'part_of' relation.
     prefix : str, optional
         Prefix to strip from term identifiers before returning. Default is `'obo.'`.
+    index : dict, optional
+        Relation index for `part_of` from `get_relation_index`. If given, the
+        entity is looked up in the index instead of scanning every class.
 
     Returns
     -------
@@ -308,12 +423,16 @@ def invert_part_of(onto, namespace, entity,
       the given entity appears in their `part_of` property values.
     - The returned list contains IDs without the given `prefix`.
     - Matching is exact — it will not resolve subclasses of the given entity.
+    - For many entities, build the index once and use `relation_subjects`.
 
     Examples
     --------
     >>> invert_part_of(onto, ns, "GO_0005739")
     ['GO_0005740', 'GO_0005741']
     """
+    if index is not None:
+        return relation_subjects(index, [entity], names=False)['Ontology ID'].tolist()
+
     part_of = onto.search_one(iri=part_of)  # 'part_of' relation
     inverted_part_of = []
     entity = entity  # Add prefix to the entity
@@ -326,7 +445,7 @@ def invert_part_of(onto, namespace, entity,
 
 def get_property_value(onto, namespace, entity, external_db='ICD-10', 
                property_iri='http://www.geneontology.org/formats/oboInOwl#hasDbXref', 
-               prefix='obo.'):
+               prefix='obo.', table=None):
     """
     Retrieve database cross-references (dbxrefs) for an ontology entity.
 
@@ -348,6 +467,9 @@ def get_property_value(onto, namespace, entity, external_db='ICD-10',
     prefix : str, optional
         Prefix to strip from ontology term IDs if used for reporting.
         Default is `'obo.'`.
+    table : pandas.DataFrame, optional
+        Annotation table from `get_annotation_table` holding `property_iri`. If
+        given, values are read from the table instead of the quadstore.
 
     Returns
     -------
@@ -362,6 +484,7 @@ def get_property_value(onto, namespace, entity, external_db='ICD-10',
     - The function does not validate the format of the dbxref — only checks 
       for substring matches to `external_db` if provided.
     - If you only need to check *existence*, use `bool(has_dbxref(...))`.
+    - For many entities, build the table once and use `annotation_values`.
 
     Examples
     --------
@@ -371,6 +494,13 @@ def get_property_value(onto, namespace, entity, external_db='ICD-10',
     >>> has_dbxref(onto, ns, "GO_0005739", external_db=None)
     ['ICD-10:C19', 'UMLS:C0025202']
     """
+    if table is not None:
+        property_name = property_iri.rsplit('#', 1)[-1].rsplit('/', 1)[-1]
+        all_items = annotation_values(table, [entity], property=property_name)['value'].tolist()
+        if external_db is not None:
+            return [item for item in all_items if external_db in item]
+        return all_items
+
     prop = onto.search_one(iri=property_iri)
     if prop is None:
         raise ValueError(f"'hasDbXref' property not found at IRI: {property_iri}")
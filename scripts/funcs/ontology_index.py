@@ -0,0 +1,673 @@
+from owlready2 import Thing, ThingClass
+import numpy as np
+import pandas as pd
+import hashlib
+import os
+import re
+
+from funcs.data import read_table, write_table
+from funcs.profiling import logger, profiled
+
+def get_ontology_version(onto):
+    """
+    Retrieve the release version of a loaded ontology.
+
+    Parameters
+    ----------
+    onto : owlready2.namespace.Ontology
+        The loaded ontology object.
+
+    Returns
+    -------
+    str
+        The `owl:versionInfo` value if present, otherwise the `owl:versionIRI`,
+        otherwise `'unversioned'`.
+
+    Examples
+    --------
+    >>> get_ontology_version(onto)
+    '2025-01-07'
+    """
+    #an ontology loaded from a release URL is also registered under its own IRI,
+    #which is where the version annotations live
+    aliases = [onto] + [other for other in onto.world.ontologies.values()
+                        if other is not onto and other.graph is not None and onto.graph is not None
+                        and other.graph.c == onto.graph.c]
+    for prop in ['owl:versionInfo', 'owl:versionIRI']:
+        for alias in aliases:
+            versions = list(onto.world.sparql(f'SELECT ?v WHERE {{ ?? {prop} ?v }}', [alias],
+                                              error_on_undefined_entities=False))
+            if versions:
+                return str(versions[0][0])
+    return 'unversioned'
+
+def _transitive_pairs(ancestor, descendant):
+    """
+    Expand direct (ancestor, descendant) edges into their transitive closure.
+
+    The closure is built breadth first by joining the current frontier back
+    onto the direct edges, so the first time a pair is reached is its shortest
+    path length. Pairs already seen (including cycles back to the start term)
+    are dropped at each step.
+
+    Parameters
+    ----------
+    ancestor, descendant : numpy.ndarray
+        Integer term codes for each direct edge.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns `ancestor`, `descendant` and `depth`, one row per pair.
+    """
+    edges = pd.DataFrame({'ancestor': ancestor, 'descendant': descendant}).drop_duplicates()
+    edges = edges.loc[edges['ancestor'] != edges['descendant']]
+    n = int(max(edges['ancestor'].max(), edges['descendant'].max())) + 1 if len(edges) else 0
+
+    frontier = edges.assign(depth=1)
+    seen = np.sort(frontier['ancestor'].to_numpy(np.int64) * n + frontier['descendant'].to_numpy(np.int64))
+    closure = [frontier]
+    depth = 1
+
+    while not frontier.empty:
+        depth += 1
+        step = frontier[['ancestor', 'descendant']].merge(edges, left_on='descendant', right_on='ancestor',
+                                                          suffixes=('', '_next'))
+        step = pd.DataFrame({'ancestor': step['ancestor'].to_numpy(), 'descendant': step['descendant_next'].to_numpy()})
+        step = step.loc[step['ancestor'] != step['descendant']]
+
+        keys = step['ancestor'].to_numpy(np.int64) * n + step['descendant'].to_numpy(np.int64)
+        keys, first = np.unique(keys, return_index=True)
+        new = ~np.isin(keys, seen, assume_unique=True)
+
+        frontier = step.iloc[first[new]].assign(depth=depth)
+        seen = np.union1d(seen, keys[new])
+        closure.append(frontier)
+
+    return pd.concat(closure, ignore_index=True)
+
+@profiled
+def build_closure_index(onto, prefix='obo.'):
+    """
+    Build a transitive-closure index over the `is_a` hierarchy of an ontology.
+
+    The ontology is walked once and every (ancestor, descendant) pair is stored
+    with the length of the shortest path between them, using integer term codes
+    so the index can be saved to disk and queried with array operations instead
+    of re-traversing `subclasses()` for every term.
+
+    Parameters
+    ----------
+    onto : owlready2.namespace.Ontology
+        The loaded ontology object. Only named classes defined in this ontology
+        are indexed; anonymous restrictions in `is_a` are ignored.
+    prefix : str, optional
+        Prefix to strip from term IDs. Default is `'obo.'`.
+
+    Returns
+    -------
+    dict
+        Dictionary of numpy arrays:
+        - `terms`: sorted term IDs; the position of a term is its integer code.
+        - `labels`: first `rdfs:label` of each term (falls back to the ID).
+        - `ancestor`, `descendant`: int32 term codes for each closure pair,
+          sorted by ancestor then descendant.
+        - `depth`: int16 shortest path length (1 for direct children).
+        - `version`: release version of the ontology.
+    """
+    parents = {}
+    labels = {}
+    for cls in onto.classes():
+        term = cls.name.replace(prefix, '')
+        labels[term] = str(cls.label[0]) if cls.label else cls.name
+        parents[term] = [p.name.replace(prefix, '') for p in cls.is_a
+                         if isinstance(p, ThingClass) and p is not Thing]
+
+    terms = np.array(sorted(set(labels) | {p for ps in parents.values() for p in ps}))
+    child = np.repeat(list(parents.keys()), [len(ps) for ps in parents.values()])
+    parent = np.array([p for ps in parents.values() for p in ps], dtype=terms.dtype)
+
+    closure = _transitive_pairs(np.searchsorted(terms, parent), np.searchsorted(terms, child))
+    closure = closure.sort_values(['ancestor', 'descendant'])
+
+    return {
+        'terms': terms,
+        'labels': np.array([labels.get(term, term) for term in terms]),
+        'ancestor': closure['ancestor'].to_numpy(np.int32),
+        'descendant': closure['descendant'].to_numpy(np.int32),
+        'depth': closure['depth'].to_numpy(np.int16),
+        'version': np.array(get_ontology_version(onto)),
+    }
+
+def save_closure_index(index, path):
+    """
+    Save a closure index to a compressed `.npz` file.
+
+    The index is written to a temporary file and moved into place, so a script
+    running in parallel never loads a half-written cache.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **index)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def load_closure_index(path):
+    """
+    Load a closure index saved with `save_closure_index`.
+    """
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def _cache_stem(onto, prefix):
+    """
+    Cache file name stem `<ontology name>.<version>.<prefix>` for an ontology release.
+
+    The prefix stripped from term IDs is part of the key, since indexes built with
+    different prefixes hold different term IDs.
+    """
+    version = re.sub(r'[^\w.-]+', '_', get_ontology_version(onto))
+    prefix = re.sub(r'[^\w-]+', '_', prefix).strip('_') or 'noprefix'
+    return f'{onto.name}.{version}.{prefix}'
+
+def get_closure_index(onto, cache_dir='data/ontology_lookups/closure', prefix='obo.', rebuild=False):
+    """
+    Load the closure index for an ontology release, building it if needed.
+
+    The index is cached as `<cache_dir>/<ontology name>.<version>.<prefix>.closure.npz`,
+    so it is built once per ontology release (and prefix) and reused by every later run.
+    Pipeline steps running in parallel may both build it; the cache is replaced
+    atomically, so each reads either no file or a complete one.
+
+    Parameters
+    ----------
+    onto : owlready2.namespace.Ontology
+        The loaded ontology object.
+    cache_dir : str, optional
+        Folder holding cached indexes. Default is `'data/ontology_lookups/closure'`.
+    prefix : str, optional
+        Prefix to strip from term IDs. Default is `'obo.'`.
+    rebuild : bool, optional
+        If True, rebuild and overwrite any cached index for this release.
+
+    Returns
+    -------
+    dict
+        The closure index (see `build_closure_index`).
+
+    Examples
+    --------
+    >>> onto, mondo = load_ontology('http://purl.obolibrary.org/obo/mondo.owl', 'http://purl.obolibrary.org/obo/')
+    >>> closure = get_closure_index(onto)
+    """
+    path = os.path.join(cache_dir, f'{_cache_stem(onto, prefix)}.closure.npz')
+
+    if os.path.exists(path) and not rebuild:
+        logger.info("Loading closure index from %s", path)
+        return load_closure_index(path)
+
+    logger.info("Building closure index for %s (%s)", onto.name, get_ontology_version(onto))
+    index = build_closure_index(onto, prefix=prefix)
+    save_closure_index(index, path)
+    return index
+
+def _term_codes(index, entity_ids):
+    """
+    Map term IDs to their integer codes, dropping (and reporting) unknown terms.
+    """
+    entity_ids = np.unique(np.asarray(entity_ids, dtype=str))
+    codes = np.searchsorted(index['terms'], entity_ids)
+    codes = np.clip(codes, 0, max(len(index['terms']) - 1, 0))
+    found = index['terms'][codes] == entity_ids if len(index['terms']) else np.zeros(len(entity_ids), bool)
+    if not found.all():
+        missing = entity_ids[~found]
+        logger.warning("%d terms not found in closure index, e.g. %s", len(missing), missing[:5].tolist())
+    return codes[found]
+
+def _closure_frame(index, query, other, depth, query_column, names):
+    data = {
+        'Ontology ID': index['terms'][other],
+        query_column: index['terms'][query],
+        'Depth': depth,
+    }
+    if names:
+        data['Name'] = index['labels'][other]
+    columns = ['Ontology ID', 'Name', query_column, 'Depth'] if names else ['Ontology ID', query_column, 'Depth']
+    return pd.DataFrame(data)[columns]
+
+def closure_descendants(index, entity_ids, names=True, direct_only=False, leaf_only=False, include_self=False):
+    """
+    Retrieve the descendants of one or more terms from a closure index.
+
+    This is the vectorized counterpart of `ontologies.get_descendants`: all
+    requested terms are answered with a single array lookup.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `get_closure_index` or `build_closure_index`.
+    entity_ids : str or list of str
+        Term ID(s) whose descendants should be retrieved.
+    names : bool, optional
+        If True (default), include human-readable labels in the output.
+    direct_only : bool, optional
+        If True, return only direct children. Default is False.
+    leaf_only : bool, optional
+        If True, return only leaf terms (no subclasses). Default is False.
+    include_self : bool, optional
+        If True, also return each queried term as its own descendant at depth 0.
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with:
+        - `"Ontology ID"`: Descendant term identifier.
+        - `"Name"`: Human-readable label (only if `names=True`).
+        - `"Ancestor"`: The queried term the row descends from.
+        - `"Depth"`: Shortest path length from the queried term.
+
+    Examples
+    --------
+    >>> closure_descendants(closure, ['MONDO_0700096'], direct_only=True).head(2)
+         Ontology ID                      Name       Ancestor  Depth
+    0  MONDO_0002409  auditory system disorder  MONDO_0700096      1
+    1  MONDO_0002657           breast disorder  MONDO_0700096      1
+    """
+    codes = _term_codes(index, np.atleast_1d(entity_ids))
+
+    mask = np.isin(index['ancestor'], codes)
+    if direct_only:
+        mask &= index['depth'] == 1
+    ancestor = index['ancestor'][mask]
+    descendant = index['descendant'][mask]
+    depth = index['depth'][mask]
+
+    if include_self:
+        ancestor = np.concatenate([codes, ancestor])
+        descendant = np.concatenate([codes, descendant])
+        depth = np.concatenate([np.zeros(len(codes), np.int16), depth])
+
+    if leaf_only:
+        leaf = ~np.isin(descendant, index['ancestor'])
+        ancestor, descendant, depth = ancestor[leaf], descendant[leaf], depth[leaf]
+
+    return _closure_frame(index, ancestor, descendant, depth, 'Ancestor', names)
+
+def closure_ancestors(index, entity_ids, names=True, include_self=False):
+    """
+    Retrieve the ancestors of one or more terms from a closure index.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `get_closure_index` or `build_closure_index`.
+    entity_ids : str or list of str
+        Term ID(s) whose ancestors should be retrieved.
+    names : bool, optional
+        If True (default), include human-readable labels in the output.
+    include_self : bool, optional
+        If True, also return each queried term as its own ancestor at depth 0.
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with:
+        - `"Ontology ID"`: Ancestor term identifier.
+        - `"Name"`: Human-readable label (only if `names=True`).
+        - `"Descendant"`: The queried term.
+        - `"Depth"`: Shortest path length up to the ancestor.
+    """
+    codes = _term_codes(index, np.atleast_1d(entity_ids))
+
+    mask = np.isin(index['descendant'], codes)
+    ancestor = index['ancestor'][mask]
+    descendant = index['descendant'][mask]
+    depth = index['depth'][mask]
+
+    if include_self:
+        ancestor = np.concatenate([codes, ancestor])
+        descendant = np.concatenate([codes, descendant])
+        depth = np.concatenate([np.zeros(len(codes), np.int16), depth])
+
+    return _closure_frame(index, descendant, ancestor, depth, 'Descendant', names)
+
+OBO_IN_OWL = 'http://www.geneontology.org/formats/oboInOwl#'
+TERM_REPLACED_BY = 'http://purl.obolibrary.org/obo/IAO_0100001'
+
+def _term_id(value, prefix='obo.'):
+    """
+    Term ID of a SPARQL result: the entity name, or a CURIE string ('HP:0000598' -> 'HP_0000598').
+    """
+    if hasattr(value, 'name'):
+        return value.name.replace(prefix, '')
+    return str(value).replace(':', '_')
+
+def _sparql_pairs(onto, query, prefix='obo.', value_is_term=False):
+    """
+    Run a two-column SPARQL query over the ontology's world, returning (term_id, value) rows
+    for named classes only.
+    """
+    rows = onto.world.sparql(query, error_on_undefined_entities=False)
+    return pd.DataFrame([(_term_id(term, prefix), _term_id(value, prefix) if value_is_term else str(value))
+                         for term, value in rows if isinstance(term, ThingClass)],
+                        columns=['term_id', 'value'])
+
+def build_label_index(onto, prefix='obo.', synonyms=('hasExactSynonym',)):
+    """
+    Build a case-insensitive label and synonym index for a loaded ontology.
+
+    All labels are read with one query per annotation property, instead of scanning
+    `namespace.classes()` for each label that needs resolving.
+
+    Parameters
+    ----------
+    onto : owlready2.namespace.Ontology
+        The loaded ontology object.
+    prefix : str, optional
+        Prefix to strip from term IDs. Default is `'obo.'`.
+    synonyms : tuple of str, optional
+        oboInOwl synonym properties to include. Default is exact synonyms only.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per (label, term) with columns:
+        - `"key"`: lower-cased, whitespace-stripped label used for matching.
+        - `"label"`: the label as written in the ontology.
+        - `"term_id"`: term identifier.
+        - `"source"`: `'label'`, the synonym property name, or `'replaced_by'`.
+
+    Notes
+    -----
+    - Obsolete terms with an IAO 'term replaced by' annotation are indexed under their
+      replacement: their label (without the leading 'obsolete ') and synonyms point to the
+      replacement term with source `'replaced_by'`.
+    - Obsolete terms without a replacement keep their own label, as in `get_term_from_label`.
+    """
+    labels = [_sparql_pairs(onto, 'SELECT ?x ?l WHERE { ?x rdfs:label ?l }', prefix).assign(source='label')]
+    for synonym in synonyms:
+        labels.append(_sparql_pairs(onto, f'SELECT ?x ?l WHERE {{ ?x <{OBO_IN_OWL}{synonym}> ?l }}', prefix).assign(source=synonym))
+    labels = pd.concat(labels, ignore_index=True)
+
+    replaced_by = _sparql_pairs(onto, f'SELECT ?x ?r WHERE {{ ?x <{TERM_REPLACED_BY}> ?r }}', prefix, value_is_term=True)
+    replaced_by = replaced_by.drop_duplicates(subset=['term_id']).set_index('term_id')['value']
+
+    obsolete = labels['term_id'].isin(replaced_by.index)
+    labels.loc[obsolete, 'value'] = labels.loc[obsolete, 'value'].str.replace(r'^obsolete ', '', regex=True)
+    labels.loc[obsolete, 'term_id'] = labels.loc[obsolete, 'term_id'].map(replaced_by)
+    labels.loc[obsolete, 'source'] = 'replaced_by'
+
+    labels = labels.rename(columns={'value': 'label'})
+    labels['key'] = labels['label'].str.strip().str.lower()
+    return labels[['key', 'label', 'term_id', 'source']].drop_duplicates(subset=['key', 'term_id', 'source']).reset_index(drop=True)
+
+def terms_from_labels(index, labels, prefer_labels=True):
+    """
+    Resolve a whole column of labels to term IDs with a single lookup.
+
+    Parameters
+    ----------
+    index : pandas.DataFrame
+        Label index from `build_label_index`.
+    labels : list-like of str
+        Labels to resolve. Matching ignores case and surrounding whitespace.
+    prefer_labels : bool, optional
+        If True (default), synonym and replacement matches are dropped for any
+        label that matches an `rdfs:label` directly.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per (query label, matching term) with columns `"query"`, `"term_id"`
+        and `"source"`. Labels with no match are kept with a missing `term_id`.
+
+    Examples
+    --------
+    >>> hp_labels = build_label_index(onto)
+    >>> terms_from_labels(hp_labels, ['Abnormality of the ear', 'ear anomaly', 'not a term'])
+                        query     term_id            source
+    0  Abnormality of the ear  HP_0000598             label
+    1             ear anomaly  HP_0000598   hasExactSynonym
+    2              not a term         NaN               NaN
+    """
+    query = pd.DataFrame({'query': pd.unique(pd.Series(labels).dropna().astype(str))})
+    query['key'] = query['query'].str.strip().str.lower()
+
+    matches = query.merge(index[['key', 'term_id', 'source']], on='key', how='left')
+    if prefer_labels:
+        direct = matches.groupby('key')['source'].transform(lambda s: (s == 'label').any())
+        matches = matches.loc[~direct | (matches['source'] == 'label')]
+
+    return matches[['query', 'term_id', 'source']].drop_duplicates().reset_index(drop=True)
+
+PART_OF = 'http://purl.obolibrary.org/obo/BFO_0000050'
+
+def build_relation_index(onto, property_iri=PART_OF, prefix='obo.'):
+    """
+    Build a forward and inverse index for an object property such as BFO part_of.
+
+    Every `subClassOf <property> some <object>` restriction in the ontology is read
+    with a single query, and the direct (subject, object) edges are expanded into
+    their transitive closure with the same integer coding as `build_closure_index`.
+
+    Parameters
+    ----------
+    onto : owlready2.namespace.Ontology
+        The loaded ontology object.
+    property_iri : str, optional
+        IRI of the object property. Default is BFO part_of.
+    prefix : str, optional
+        Prefix to strip from term IDs. Default is `'obo.'`.
+
+    Returns
+    -------
+    dict
+        Dictionary of numpy arrays:
+        - `terms`: sorted term IDs; the position of a term is its integer code.
+        - `labels`: first `rdfs:label` of each term (falls back to the ID).
+        - `subject`, `object`: int32 term codes for each pair where `subject`
+          is related to `object` (e.g. subject part_of object), directly or transitively.
+        - `depth`: int16 number of relation steps (1 for asserted edges).
+        - `property`, `version`: property IRI and ontology release version.
+    """
+    rows = onto.world.sparql(f'''SELECT ?x ?y WHERE {{ ?x rdfs:subClassOf ?r . ?r owl:onProperty <{property_iri}> .
+                                 ?r owl:someValuesFrom ?y }}''', error_on_undefined_entities=False)
+    edges = [(x, y) for x, y in rows if isinstance(x, ThingClass) and isinstance(y, ThingClass)]
+
+    labels = {}
+    for entity in {e for edge in edges for e in edge}:
+        labels[entity.name.replace(prefix, '')] = str(entity.label[0]) if entity.label else entity.name
+    terms = np.array(sorted(labels), dtype=str)
+
+    subject = np.searchsorted(terms, [x.name.replace(prefix, '') for x, _ in edges])
+    obj = np.searchsorted(terms, [y.name.replace(prefix, '') for _, y in edges])
+    closure = _transitive_pairs(obj, subject).sort_values(['ancestor', 'descendant'])
+
+    return {
+        'terms': terms,
+        'labels': np.array([labels[term] for term in terms], dtype=str),
+        'subject': closure['descendant'].to_numpy(np.int32),
+        'object': closure['ancestor'].to_numpy(np.int32),
+        'depth': closure['depth'].to_numpy(np.int16),
+        'property': np.array(property_iri),
+        'version': np.array(get_ontology_version(onto)),
+    }
+
+def get_relation_index(onto, property_iri=PART_OF, cache_dir='data/ontology_lookups/closure', prefix='obo.', rebuild=False):
+    """
+    Load the relation index for an ontology release and property, building it if needed.
+
+    Cached as `<cache_dir>/<ontology name>.<version>.<prefix>.<property name>.relation.npz`,
+    written through `save_closure_index` so that parallel steps never read a partial file.
+
+    Examples
+    --------
+    >>> part_of = get_relation_index(uberon)
+    >>> relation_subjects(part_of, ['UBERON_0001690'])
+    """
+    name = re.sub(r'[^\w.-]+', '_', property_iri.rstrip('/#').rsplit('/', 1)[-1].rsplit('#', 1)[-1])
+    path = os.path.join(cache_dir, f'{_cache_stem(onto, prefix)}.{name}.relation.npz')
+
+    if os.path.exists(path) and not rebuild:
+        logger.info("Loading relation index from %s", path)
+        return load_closure_index(path)
+
+    logger.info("Building %s relation index for %s (%s)", name, onto.name, get_ontology_version(onto))
+    index = build_relation_index(onto, property_iri=property_iri, prefix=prefix)
+    save_closure_index(index, path)
+    return index
+
+def _relation_lookup(index, entity_ids, query, result, transitive, names):
+    """
+    Shared lookup for `relation_subjects` and `relation_objects`.
+    """
+    codes = _term_codes(index, np.atleast_1d(entity_ids))
+    mask = np.isin(index[query], codes)
+    if not transitive:
+        mask &= index['depth'] == 1
+    return _closure_frame(index, index[query][mask], index[result][mask], index['depth'][mask], 'Query', names)
+
+def relation_subjects(index, entity_ids, transitive=False, names=True):
+    """
+    Terms related to each query term through the inverse of the property.
+
+    For part_of this gives the parts of each term, i.e. the batch version of
+    `ontologies.invert_part_of`.
+
+    Parameters
+    ----------
+    index : dict
+        Relation index from `build_relation_index` / `get_relation_index`.
+    entity_ids : str or list of str
+        Query term IDs.
+    transitive : bool, optional
+        If True, include parts of parts. Default is asserted edges only.
+    names : bool, optional
+        If True (default), include a `"Name"` column.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns `"Ontology ID"`, `"Name"`, `"Query"` and `"Depth"`, one row per
+        (related term, query term) pair.
+    """
+    return _relation_lookup(index, entity_ids, 'object', 'subject', transitive, names)
+
+def relation_objects(index, entity_ids, transitive=False, names=True):
+    """
+    Terms each query term is related to through the property.
+
+    For part_of this gives the structures each term is part of. Parameters and
+    return value are as for `relation_subjects`.
+    """
+    return _relation_lookup(index, entity_ids, 'subject', 'object', transitive, names)
+
+HAS_DBXREF = OBO_IN_OWL + 'hasDbXref'
+
+def build_annotation_table(onto, properties=(HAS_DBXREF,), prefix='obo.'):
+    """
+    Read every value of the given annotation properties into one long table.
+
+    All properties are fetched with a single query over the quadstore, instead of
+    resolving the property and reading it one entity at a time as
+    `get_property_value` does.
+
+    Parameters
+    ----------
+    onto : owlready2.namespace.Ontology
+        The loaded ontology object.
+    properties : list of str, optional
+        Annotation property IRIs to extract. Default is `oboInOwl:hasDbXref`.
+    prefix : str, optional
+        Prefix to strip from term IDs. Default is `'obo.'`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per (term, property, value), sorted by term, with columns:
+        - `"term_id"`: term identifier.
+        - `"property"`: property name (e.g. `'hasDbXref'`), categorical.
+        - `"value"`: annotation value as a string.
+        - `"source_prefix"`: the part of the value before the first `':'`
+          (e.g. `'ICD10CM'`, `'OMIM'`), categorical; missing if there is none.
+
+    Examples
+    --------
+    >>> xrefs = build_annotation_table(onto)
+    >>> xrefs.loc[xrefs['source_prefix'] == 'OMIM'].head(1)
+             term_id   property        value source_prefix
+    0  MONDO_0007739  hasDbXref  OMIM:143100          OMIM
+    """
+    values = ', '.join(f'<{iri}>' for iri in properties)
+    rows = onto.world.sparql(f'SELECT ?x ?p ?v WHERE {{ ?x ?p ?v . FILTER(?p IN ({values})) }}',
+                             error_on_undefined_entities=False)
+    table = pd.DataFrame([(term.name.replace(prefix, ''), getattr(prop, 'name', str(prop)), str(value))
+                          for term, prop, value in rows if isinstance(term, ThingClass)],
+                         columns=['term_id', 'property', 'value'])
+
+    table['source_prefix'] = table['value'].str.extract(r'^([^:\s]+):', expand=False).astype('category')
+    table['property'] = table['property'].astype('category')
+    return table.drop_duplicates().sort_values(['term_id', 'property', 'value'], ignore_index=True)
+
+def get_annotation_table(onto, properties=(HAS_DBXREF,), cache_dir='data/ontology_lookups/closure', prefix='obo.', rebuild=False):
+    """
+    Load the annotation table for an ontology release, building it if needed.
+
+    Cached as `<cache_dir>/<ontology name>.<version>.<prefix>.annotations.<hash>.parquet`,
+    where the hash identifies the set of properties extracted. `write_table` replaces the
+    file atomically, so parallel steps never read a partial table.
+    """
+    key = hashlib.sha1('\0'.join(sorted(properties)).encode()).hexdigest()[:10]
+    path = os.path.join(cache_dir, f'{_cache_stem(onto, prefix)}.annotations.{key}')
+
+    if os.path.exists(path + '.parquet') and not rebuild:
+        logger.info("Loading annotation table from %s.parquet", path)
+        return read_table(path)
+
+    logger.info("Building annotation table for %s (%s)", onto.name, get_ontology_version(onto))
+    table = build_annotation_table(onto, properties=properties, prefix=prefix)
+    write_table(table, path, categorical=['property', 'source_prefix'])
+    return table
+
+def annotation_values(table, term_ids, source_prefix=None, property=None):
+    """
+    Look up the annotation values of many terms at once (term -> value).
+
+    Parameters
+    ----------
+    table : pandas.DataFrame
+        Table from `build_annotation_table` / `get_annotation_table`.
+    term_ids : str or list of str
+        Terms to look up.
+    source_prefix : str or list of str, optional
+        Keep only values from these sources (e.g. `'ICD10CM'`). Default is all.
+    property : str or list of str, optional
+        Keep only these property names (e.g. `'hasDbXref'`). Default is all.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Matching rows of `table`.
+    """
+    mask = table['term_id'].isin(np.atleast_1d(term_ids))
+    if source_prefix is not None:
+        mask &= table['source_prefix'].isin(np.atleast_1d(source_prefix))
+    if property is not None:
+        mask &= table['property'].isin(np.atleast_1d(property))
+    return table.loc[mask].reset_index(drop=True)
+
+def annotation_terms(table, values, property=None):
+    """
+    Look up the terms carrying any of the given annotation values (value -> term),
+    e.g. the MONDO terms cross-referenced to a list of OMIM IDs.
+
+    Returns the matching rows of `table`.
+    """
+    mask = table['value'].isin(np.atleast_1d(values))
+    if property is not None:
+        mask &= table['property'].isin(np.atleast_1d(property))
+    return table.loc[mask].reset_index(drop=True)
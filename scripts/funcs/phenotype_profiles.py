@@ -0,0 +1,186 @@
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from funcs.profiling import profiled
+from funcs.similarity import ancestor_matrix, term_index
+
+# popcount of every byte value, for numpy versions without np.bitwise_count
+_BYTE_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def popcount(bits):
+    """
+    Number of set bits in each row of a packed uint8 array (summed over the last axis).
+
+    Rows are padded to whole 64-bit words by _pack, so they are counted a word at a time.
+    """
+    bits = np.ascontiguousarray(bits)
+    if hasattr(np, 'bitwise_count'):
+        words = bits.view(np.uint64) if bits.shape[-1] % 8 == 0 else bits
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _BYTE_COUNTS[bits].sum(axis=-1, dtype=np.int64)
+
+def _pack(rows, cols, n_rows, n_terms):
+    """
+    Packed bit matrix (n_rows x bytes) with the (row, col) bits set, in the bit order of
+    np.packbits. Rows are padded with zero bits to a whole number of 64-bit words.
+    """
+    bits = np.zeros((n_rows, (n_terms + 63) // 64 * 8), dtype=np.uint8)
+    np.bitwise_or.at(bits, (rows, cols >> 3), (0x80 >> (cols & 7)).astype(np.uint8))
+    return bits
+
+@profiled
+def build_profiles(index, annotations, group, term, close_ancestors=True):
+    """
+    Pack each group's phenotype terms (e.g. each gene's mouse phenotypes) into a bit
+    array over the ontology's term space.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `ontology_index.get_closure_index`; bit `i` is term code `i`.
+    annotations : pandas.DataFrame
+        (group, term) table, e.g. the output of `mouse.get_opentargets_mouse`.
+    group, term : str
+        Group (e.g. `'gene_id'`) and term (e.g. `'mp_id'`) columns of `annotations`.
+    close_ancestors : bool, optional
+        If True (default), every ancestor of an annotated term is set as well, so a
+        gene with an MP term is counted under every subtree containing it.
+
+    Returns
+    -------
+    dict
+        - `bits`: uint8 array (groups x bytes) of packed profiles, one bit per term.
+        - `groups`: sorted group IDs, one per row of `bits`.
+        - `terms`: the index's term IDs, one per bit.
+    """
+    annotations = annotations[[group, term]].dropna()
+    codes = term_index(index, annotations[term])
+    annotations = annotations.loc[codes >= 0]
+    codes = codes[codes >= 0]
+
+    group_codes, groups = pd.factorize(annotations[group].astype(str), sort=True)
+    n_terms = len(index['terms'])
+    profile = sp.csr_matrix((np.ones(len(codes), dtype=np.int32), (group_codes, codes)), shape=(len(groups), n_terms))
+    if close_ancestors:
+        profile = profile @ ancestor_matrix(index).astype(np.int32)
+    profile = profile.tocoo()
+
+    return {'bits': _pack(profile.row, profile.col, len(groups), n_terms),
+            'groups': np.asarray(groups, dtype=str),
+            'terms': index['terms']}
+
+def subtree_masks(index, subtrees, include_self=True):
+    """
+    Packed masks of the terms under each subtree.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index the profiles were built with.
+    subtrees : list of (str or list of str)
+        One entry per mask: a root term, or several root terms whose subtrees are
+        combined (e.g. all MP ancestors mapped to one organ system).
+    include_self : bool, optional
+        If True (default), the root terms are part of their subtree.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 array (len(subtrees) x bytes), packed like the profiles.
+    """
+    rows, cols = [], []
+    for i, roots in enumerate(subtrees):
+        codes = term_index(index, np.atleast_1d(roots))
+        codes = codes[codes >= 0]
+        terms = index['descendant'][np.isin(index['ancestor'], codes)]
+        if include_self:
+            terms = np.concatenate([codes, terms])
+        rows.append(np.full(len(terms), i))
+        cols.append(terms)
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    cols = np.concatenate(cols).astype(np.int64) if cols else np.array([], dtype=np.int64)
+    return _pack(rows, cols, len(subtrees), len(index['terms']))
+
+def count_hits(profiles, masks):
+    """
+    Number of profile terms inside each mask: popcount(profile AND mask).
+
+    Parameters
+    ----------
+    profiles : dict or numpy.ndarray
+        Output of `build_profiles`, or its packed `bits`.
+    masks : numpy.ndarray
+        Packed masks from `subtree_masks` (or profile rows).
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 array (profiles x masks).
+    """
+    bits = profiles['bits'] if isinstance(profiles, dict) else profiles
+    counts = np.zeros((len(bits), len(masks)), dtype=np.int64)
+    for i, mask in enumerate(masks):
+        counts[:, i] = popcount(bits & mask)
+    return counts
+
+def intersect(profiles, rows, masks):
+    """
+    Packed intersection of the selected profile rows with masks (or other profiles) of
+    the same shape, e.g. the phenotypes a gene has inside an organ-system subtree.
+    """
+    bits = profiles['bits'] if isinstance(profiles, dict) else profiles
+    return bits[rows] & masks
+
+def overlap(profiles, query_rows, other_rows=None, jaccard=False):
+    """
+    Shared term counts (or Jaccard indices) between profiles.
+
+    Parameters
+    ----------
+    profiles : dict or numpy.ndarray
+        Output of `build_profiles`, or its packed `bits`.
+    query_rows : array-like of int
+        Rows of the query profiles.
+    other_rows : array-like of int, optional
+        Rows to compare against; default is every profile.
+    jaccard : bool, optional
+        If True, return |A & B| / |A | B| instead of |A & B|.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array (len(query_rows) x len(other_rows)).
+    """
+    bits = profiles['bits'] if isinstance(profiles, dict) else profiles
+    other = bits if other_rows is None else bits[other_rows]
+    query = bits[np.atleast_1d(query_rows)]
+
+    shared = count_hits(other, query).T
+    if not jaccard:
+        return shared
+    union = popcount(query)[:, None] + popcount(other)[None, :] - shared
+    return np.divide(shared, union, out=np.zeros(shared.shape), where=union > 0)
+
+def unpack_terms(profiles, row):
+    """
+    Term IDs set in one profile row.
+    """
+    bits = np.unpackbits(profiles['bits'][row])[:len(profiles['terms'])]
+    return profiles['terms'][bits.astype(bool)]
+
+def save_profiles(profiles, path):
+    """
+    Save packed profiles to a compressed `.npz` file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(path, **profiles)
+
+def load_profiles(path):
+    """
+    Load profiles saved with `save_profiles`.
+    """
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
@@ -0,0 +1,164 @@
+import contextlib
+import cProfile
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+logger = logging.getLogger('geneprioritisation')
+
+#one record per profiled stage in this process, in the order they finished
+_records = []
+
+#stages to capture with cProfile / tracemalloc, set by configure_profiling
+_settings = {'cprofile': set(), 'tracemalloc': set(), 'output_dir': 'data/profiles'}
+
+def setup_logging(level=None):
+    '''
+    Send pipeline log messages to stderr. The level defaults to the GENEPRIO_LOG_LEVEL
+    environment variable, or INFO; DEBUG also logs table previews.
+    '''
+    level = level or os.environ.get('GENEPRIO_LOG_LEVEL', 'INFO')
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+def configure_profiling(cprofile=(), tracemalloc=(), output_dir='data/profiles'):
+    '''
+    Turn on detailed capture for named stages: cProfile stats are saved to
+    '<output_dir>/<stage>.prof' and tracemalloc records the stage's peak traced
+    allocation and its largest allocation sites.
+
+    Stages can also be named in the GENEPRIO_CPROFILE and GENEPRIO_TRACEMALLOC
+    environment variables (comma separated), which reach pipeline worker processes.
+    '''
+    _settings['cprofile'] = set(cprofile)
+    _settings['tracemalloc'] = set(tracemalloc)
+    _settings['output_dir'] = output_dir
+
+def _capture(kind, name):
+    names = _settings[kind] | set(filter(None, os.environ.get(f'GENEPRIO_{kind.upper()}', '').split(',')))
+    return name in names or '*' in names
+
+def count_rows(obj):
+    '''
+    Number of rows in a DataFrame, Series, array or Arrow table, summed over tuples
+    and lists of them. Returns None for anything else.
+    '''
+    if isinstance(obj, (tuple, list)):
+        counts = [count_rows(item) for item in obj]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    if hasattr(obj, 'num_rows'):
+        return obj.num_rows
+    shape = getattr(obj, 'shape', None)
+    if shape:
+        return shape[0]
+    return None
+
+def _max_rss_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+@contextlib.contextmanager
+def profile_stage(name, rows_in=None, level=logging.INFO):
+    '''
+    Time a block of code and record it in this run's profile.
+
+    Yields the record, so `rows_in`/`rows_out` (or any other value) can be filled in
+    inside the block. Recorded values:
+    - wall_s, cpu_s: elapsed and process CPU time.
+    - peak_rss_mb: the process's peak resident memory after the stage.
+    - rss_growth_mb: how much the stage raised that peak (0 if it stayed below it).
+    - traced_peak_mb, top_allocations: only with tracemalloc capture for this stage.
+
+    Examples
+    --------
+    >>> with profile_stage('merge l2g', rows_in=len(l2g)) as stage:
+    ...     l2g = l2g.merge(gwas, on='studyLocusId')
+    ...     stage['rows_out'] = len(l2g)
+    '''
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    profiler = cProfile.Profile() if _capture('cprofile', name) else None
+    trace = _capture('tracemalloc', name) and not tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.start()
+
+    rss_before = _max_rss_mb()
+    start, cpu = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record['wall_s'] = round(time.perf_counter() - start, 4)
+        record['cpu_s'] = round(time.process_time() - cpu, 4)
+        record['peak_rss_mb'] = round(_max_rss_mb(), 1)
+        record['rss_growth_mb'] = round(record['peak_rss_mb'] - rss_before, 1)
+
+        if trace:
+            record['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+            record['top_allocations'] = [str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:10]]
+            tracemalloc.stop()
+        if profiler is not None:
+            os.makedirs(_settings['output_dir'], exist_ok=True)
+            record['cprofile'] = os.path.join(_settings['output_dir'], f'{name}.prof')
+            profiler.dump_stats(record['cprofile'])
+
+        _records.append(record)
+        logger.log(level, '%s: %.2fs wall, %.2fs cpu, peak RSS %.0f MB (+%.0f), rows %s -> %s', name, record['wall_s'],
+                   record['cpu_s'], record['peak_rss_mb'], record['rss_growth_mb'], record['rows_in'], record['rows_out'])
+
+def profiled(func=None, name=None, level=logging.INFO):
+    '''
+    Decorator recording every call of a function with `profile_stage`.
+
+    Rows in are counted from the first positional argument that is a table, rows out
+    from the return value. The stage is named after the function unless `name` is given.
+    '''
+    if func is None:
+        return functools.partial(profiled, name=name, level=level)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rows_in = next((rows for rows in map(count_rows, args) if rows is not None), None)
+        with profile_stage(name or func.__name__, rows_in=rows_in, level=level) as stage:
+            result = func(*args, **kwargs)
+            stage['rows_out'] = count_rows(result)
+        return result
+    return wrapper
+
+def log_table(message, df, rows=5):
+    '''
+    Log a table's shape at DEBUG level, with its first rows, instead of printing it.
+    '''
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s: %s rows\n%s', message, count_rows(df), df.head(rows).to_string() if hasattr(df, 'head') else df)
+
+def get_profile():
+    '''
+    This run's profile as a DataFrame, one row per stage call.
+    '''
+    return pd.DataFrame(_records)
+
+def reset_profile():
+    _records.clear()
+
+def export_profile(path):
+    '''
+    Save this run's profile as JSON or, if `path` ends in .csv, as CSV.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.csv'):
+        get_profile().to_csv(path, index=False)
+    else:
+        with open(path, 'w') as f:
+            json.dump(_records, f, indent=1)
+    logger.info('Profile of %d stages saved to %s', len(_records), path)
@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from funcs.profiling import logger, profiled
+
+def term_index(index, entity_ids):
+    """
+    Integer codes of term IDs in a closure index, -1 for terms not in the index.
+    """
+    entity_ids = np.asarray(entity_ids, dtype=str)
+    terms = index['terms']
+    if not len(terms):
+        return np.full(len(entity_ids), -1)
+    codes = np.clip(np.searchsorted(terms, entity_ids), 0, len(terms) - 1)
+    return np.where(terms[codes] == entity_ids, codes, -1)
+
+def ancestor_matrix(index):
+    """
+    Sparse terms x terms matrix whose row for a term marks the term and all of its ancestors.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `ontology_index.get_closure_index`.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Boolean CSR matrix; row `i` holds the ancestor set ("bitset") of term code `i`.
+    """
+    n_terms = len(index['terms'])
+    rows = np.concatenate([np.arange(n_terms), index['descendant']])
+    cols = np.concatenate([np.arange(n_terms), index['ancestor']])
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n_terms, n_terms))
+    matrix.sort_indices()
+    return matrix
+
+def information_content(index, annotations=None):
+    """
+    Information content (IC) of every term in a closure index.
+
+    Without annotations the intrinsic IC of Seco et al. (2004) is used,
+    `1 - log(descendants + 1) / log(number of terms)`, which only needs the
+    hierarchy. With annotations the corpus IC `-log(p(term))` is used, where
+    `p(term)` is the share of annotations made to the term or any descendant.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `ontology_index.get_closure_index`.
+    annotations : list-like of str, optional
+        Annotated term IDs, one entry per annotation (e.g. the `mp_id` column of
+        every gene-phenotype pair). Terms not in the index are ignored.
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 IC per term code, aligned with `index['terms']`. Terms with no
+        annotations get the highest IC of the annotated terms.
+    """
+    n_terms = len(index['terms'])
+    if annotations is None:
+        descendants = np.bincount(index['ancestor'], minlength=n_terms)
+        return 1 - np.log(descendants + 1) / np.log(max(n_terms, 2))
+
+    codes = term_index(index, annotations)
+    direct = np.bincount(codes[codes >= 0], minlength=n_terms).astype(np.float64)
+    counts = direct + np.bincount(index['ancestor'], weights=direct[index['descendant']], minlength=n_terms)
+
+    ic = np.full(n_terms, np.nan)
+    annotated = counts > 0
+    ic[annotated] = -np.log(counts[annotated] / direct.sum())
+    ic[~annotated] = ic[annotated].max() if annotated.any() else 0
+    return ic
+
+def term_similarity(index, ic, query_terms, target_terms, method='resnik', ancestors=None, chunk_size=1000000):
+    """
+    Pairwise semantic similarity between two lists of terms.
+
+    The Resnik similarity of two terms is the IC of their most informative common
+    ancestor (MICA). For every query term, the IC of each of its ancestors is
+    masked by the target terms' ancestor bitsets and the maximum is taken per
+    query term with `np.maximum.reduceat`, so no pair of terms is visited in Python.
+    Lin similarity rescales Resnik to 0-1: `2 * IC(MICA) / (IC(a) + IC(b))`.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `ontology_index.get_closure_index`.
+    ic : numpy.ndarray
+        IC per term code, from `information_content`.
+    query_terms, target_terms : list-like of str
+        Term IDs. Terms not in the index have similarity 0.
+    method : {'resnik', 'lin'}, optional
+        Similarity measure. Default is `'resnik'`.
+    ancestors : scipy.sparse.csr_matrix, optional
+        Precomputed `ancestor_matrix(index)`, to reuse across calls.
+    chunk_size : int, optional
+        Maximum number of (query ancestor, target term) cells held in memory at once.
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 matrix of shape (len(query_terms), len(target_terms)).
+    """
+    if method not in ('resnik', 'lin'):
+        raise ValueError(f"Unknown similarity method: {method}")
+    ancestors = ancestor_matrix(index) if ancestors is None else ancestors
+
+    query = term_index(index, query_terms)
+    target = term_index(index, target_terms)
+    similarity = np.zeros((len(query), len(target)))
+    found_query, found_target = np.flatnonzero(query >= 0), np.flatnonzero(target >= 0)
+    if not len(found_query) or not len(found_target):
+        return similarity
+
+    # dense bitsets of the (usually few) target terms, rows of the (many) query terms
+    target_bits = ancestors[target[found_target]].toarray()
+    query_rows = ancestors[query[found_query]]
+    lengths = np.diff(query_rows.indptr)
+
+    step = max(1, chunk_size // max(len(found_target), 1))
+    bounds = np.searchsorted(query_rows.indptr, np.arange(0, query_rows.nnz + step, step))
+    bounds = np.unique(np.append(np.clip(bounds, 0, len(found_query)), len(found_query)))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        cols = query_rows.indices[query_rows.indptr[start]:query_rows.indptr[stop]]
+        shared = target_bits[:, cols] * ic[cols]
+        offsets = query_rows.indptr[start:stop] - query_rows.indptr[start]
+        # every term is its own ancestor, so no query row is empty
+        similarity[found_query[start:stop][:, None], found_target] = np.maximum.reduceat(shared, offsets, axis=1).T
+
+    if method == 'lin':
+        total = ic[np.maximum(query, 0)][:, None] + ic[np.maximum(target, 0)][None, :]
+        similarity = np.divide(2 * similarity, total, out=np.zeros_like(similarity), where=total > 0)
+    return similarity
+
+def _group_codes(terms, groups):
+    """
+    Unique terms and groups of a (group, term) table, with the code of each row's term and group.
+    """
+    term_codes, unique_terms = pd.factorize(pd.Series(terms).astype(str), sort=True)
+    group_codes, unique_groups = pd.factorize(pd.Series(groups), sort=True)
+    return term_codes, unique_terms, group_codes, unique_groups
+
+def _group_mean(rows, group_codes, term_codes, n_groups):
+    """
+    Mean of `rows` (one per term) over each group's terms: groups x columns.
+    """
+    membership = sp.csr_matrix((np.ones(len(group_codes)), (group_codes, term_codes)), shape=(n_groups, rows.shape[0]))
+    counts = np.asarray(membership.sum(axis=1)).ravel()
+    return (membership @ rows) / np.maximum(counts, 1)[:, None]
+
+def _group_max(rows, group_codes, term_codes):
+    """
+    Maximum of `rows` (one per term) over each group's terms: groups x columns.
+    """
+    order = np.argsort(group_codes, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(group_codes[order]) != 0])
+    return np.maximum.reduceat(rows[term_codes[order]], starts, axis=0)
+
+@profiled
+def set_similarity(index, query, target, query_group, target_group, term='term', ic=None, method='resnik', combine='bma'):
+    """
+    Semantic similarity between every pair of term sets, e.g. each gene's mouse
+    phenotypes against each organ system's MP ancestor terms.
+
+    The term x term similarity matrix is computed once for the unique terms of both
+    tables (`term_similarity`), then reduced to groups with segment maxima and
+    sparse averaging, so all genes are scored against all organ systems at once.
+
+    Parameters
+    ----------
+    index : dict
+        Closure index from `ontology_index.get_closure_index`.
+    query, target : pandas.DataFrame
+        (group, term) tables, one row per term of a set.
+    query_group, target_group : str
+        Group columns of `query` and `target` (e.g. `'gene_id'`, `'mondo_ancestor_id'`).
+    term : str or tuple of str, optional
+        Term column, or (query term column, target term column). Default is `'term'`.
+    ic : numpy.ndarray, optional
+        IC per term code; defaults to the intrinsic IC from `information_content`.
+    method : {'resnik', 'lin'}, optional
+        Term similarity measure. Default is `'resnik'`.
+    combine : {'bma', 'max'}, optional
+        `'bma'` (best-match average): the mean over both sets of each term's best
+        match in the other set. `'max'`: the best single term match.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per (query group, target group) pair with columns `query_group`,
+        `target_group` and `similarity`.
+
+    Examples
+    --------
+    >>> organ_systems = ancestor_map(ontology_lookup, 'mp_ancestor_id')
+    >>> set_similarity(mp_closure, mouse, organ_systems, 'gene_id', 'mondo_ancestor_id',
+    ...                term=('mp_id', 'mp_ancestor_id'), combine='bma')
+    """
+    if combine not in ('bma', 'max'):
+        raise ValueError(f"Unknown set similarity: {combine}")
+    query_term, target_term = (term, term) if isinstance(term, str) else term
+    ic = information_content(index) if ic is None else ic
+
+    query = query[[query_group, query_term]].dropna().drop_duplicates()
+    target = target[[target_group, target_term]].dropna().drop_duplicates()
+    q_terms, q_unique, q_groups, q_unique_groups = _group_codes(query[query_term], query[query_group])
+    t_terms, t_unique, t_groups, t_unique_groups = _group_codes(target[target_term], target[target_group])
+
+    missing = (term_index(index, q_unique) < 0).sum() + (term_index(index, t_unique) < 0).sum()
+    if missing:
+        logger.info('%d terms not in the closure index have similarity 0', missing)
+
+    similarity = term_similarity(index, ic, q_unique, t_unique, method=method)
+
+    # best match of each query term in each target set: query terms x target groups
+    query_best = _group_max(similarity.T, t_groups, t_terms).T
+    if combine == 'max':
+        scores = _group_max(query_best, q_groups, q_terms)
+    else:
+        # best match of each target term in each query set: query groups x target terms
+        target_best = _group_max(similarity, q_groups, q_terms)
+        scores = 0.5 * (_group_mean(query_best, q_groups, q_terms, len(q_unique_groups))
+                        + _group_mean(target_best.T, t_groups, t_terms, len(t_unique_groups)).T)
+
+    return pd.DataFrame({query_group: np.repeat(np.asarray(q_unique_groups), len(t_unique_groups)),
+                         target_group: np.tile(np.asarray(t_unique_groups), len(q_unique_groups)),
+                         'similarity': scores.ravel()})
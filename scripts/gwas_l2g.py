@@ -1,22 +1,36 @@
 import pandas as pd
 import numpy as np
 
-from funcs.data import read_parquet_files
-from funcs.ontologies import load_ontology, get_descendants
+from funcs.data import read_ontology_mapping, read_parquet_files, read_table, write_table
+from funcs.general import explode_list_columns, group_unique
+from funcs.ontologies import load_ontology
+from funcs.ontology_index import get_closure_index, closure_descendants
+from funcs.profiling import export_profile, profiled, setup_logging
 
-def get_opentargets_l2g(study_type='gwas', drop_duplicates = True):
+@profiled
+def get_opentargets_l2g(study_type='gwas', drop_duplicates = True, gene_ids = None):
+    '''
+    Locus-to-gene scores for every credible set of the given study type.
+
+    l2g_prediction is only read for the studyLocusIds of those credible sets (and, if
+    `gene_ids` is given, for those genes), so other loci are never loaded.
+    '''
 
     #get GWAS loci
-    gwas = read_parquet_files('data/opentargets/study/study', primary_filter_id='studyType', primary_filter=[study_type])
+    gwas = read_parquet_files('data/opentargets/study/study', primary_filter_id='studyType', primary_filter=[study_type],
+                              columns=['studyId', 'pubmedId', 'diseaseIds'])
     
     study_ids = gwas['studyId'].unique().tolist()
     
-    gwas_loci = read_parquet_files('data/opentargets/credible_set/credible_set', primary_filter_id='studyId', primary_filter = study_ids)
+    gwas_loci = read_parquet_files('data/opentargets/credible_set/credible_set', primary_filter_id='studyId', primary_filter = study_ids,
+                                   columns=['studyId', 'studyLocusId'])
 
     gwas = gwas.merge(gwas_loci[['studyId', 'studyLocusId']], on='studyId', how='right')
 
     #get coloc results
-    locus2gene = read_parquet_files('data/opentargets/l2g_predictor/l2g_prediction')
+    locus2gene = read_parquet_files('data/opentargets/l2g_predictor/l2g_prediction', columns=['studyLocusId', 'geneId', 'score'],
+                                    primary_filter_id='geneId', primary_filter=gene_ids,
+                                    secondary_filter_id='studyLocusId', secondary_filter=gwas_loci['studyLocusId'])
 
     gwas = gwas[['studyId', 'studyLocusId', 'pubmedId', 'diseaseIds']]
     gwas['diseaseId'] = gwas['diseaseIds'].apply(lambda x: x[0] if isinstance(x, (list, np.ndarray)) and len(x) > 0 else np.nan)
@@ -31,28 +45,26 @@ def get_opentargets_l2g(study_type='gwas', drop_duplicates = True):
 
     return locus2gene
     
+@profiled
 def get_ancestors():
-    ontology_lookup = pd.read_csv('data/ontology_mapping.manualedits.txt', sep='\t')
-
-    onto, efo = load_ontology('http://www.ebi.ac.uk/efo/releases/v3.81.0/efo.owl', 'http://www.ebi.ac.uk/efo/')
-    efo_terms = []
-    for i,row in ontology_lookup.iterrows():
-        id = row['efo_ancestor_id']
-        label = row['efo_ancestor_label']
-         #skip if nan
-        # Skip if missing or blank
-        if pd.isna(id) or id.strip() == '' or id.lower() == 'nan':
-            continue
-        if id.startswith('MONDO'):
-            term = get_descendants(onto, efo, id, prefix = 'efo.', alternate_iri='http://purl.obolibrary.org/obo/')
-        else:
-            term = get_descendants(onto, efo, id, prefix = 'efo.')
-        term['efo_ancestor_id'] = id
-        term['efo_ancestor_label'] = label
-        term.to_csv(f'data/ontology_lookups/efo/{id}.txt', sep='\t', index=False)
-        efo_terms.append(term)
+    ontology_lookup = read_ontology_mapping()
+
+    onto, efo = load_ontology('http://www.ebi.ac.uk/efo/releases/v3.81.0/efo.owl', 'http://www.ebi.ac.uk/efo/',
+                             cache_dir='data/ontology_lookups/snapshots', version='3.81.0')
+    closure = get_closure_index(onto, prefix = 'efo.')
+
+    #one row per EFO ancestor (blank and missing IDs are dropped by explode_list_columns)
+    ancestors = explode_list_columns(ontology_lookup[['efo_ancestor_id', 'efo_ancestor_label']], ['efo_ancestor_id', 'efo_ancestor_label'])
+    ancestors = ancestors.drop_duplicates(keep='first')
 
-    efo_terms = pd.concat(efo_terms, ignore_index=True)
+    #MONDO terms imported into EFO are indexed by their own ID, so no alternate IRI is needed
+    efo_terms = closure_descendants(closure, ancestors['efo_ancestor_id'])
+    efo_terms = efo_terms.rename(columns={'Ancestor':'efo_ancestor_id'})
+    efo_terms = efo_terms.merge(ancestors, on='efo_ancestor_id', how='left')
+    efo_terms = efo_terms[['Ontology ID', 'Name', 'efo_ancestor_id', 'efo_ancestor_label']]
+
+    for id, term in efo_terms.groupby('efo_ancestor_id'):
+        term.to_csv(f'data/ontology_lookups/efo/{id}.txt', sep='\t', index=False)
 
     efo_terms = efo_terms.rename(columns={'Ontology ID':'gwas_id_efo', 'Name':'gwas_label'})
     return efo_terms
@@ -64,13 +76,14 @@ def main():
 
     efo_terms = efo_terms.merge(l2g, on = 'gwas_id_efo', how='right')
     efo_terms.dropna(subset=['efo_ancestor_id', 'efo_ancestor_label'], inplace=True)
-    efo_terms.to_csv('data/opentargets_formatted/l2g.txt', sep='\t', index=False)
+    write_table(efo_terms, 'data/opentargets_formatted/l2g')
     
      #get clingen genes
-    clingen = pd.read_csv('data/clingen.formatted.txt', sep='\t')
-    ontology_lookup = pd.read_csv('data/ontology_mapping.manualedits.txt', sep='\t')
+    clingen = read_table('data/clingen.formatted')
+    ontology_lookup = read_ontology_mapping()
     clingen = clingen.drop_duplicates(subset=['gene_id', 'mondo_disease_id', 'mondo_ancestor_id'])
     clingen = clingen.merge(ontology_lookup, on='mondo_ancestor_id', how='left')
+    clingen = explode_list_columns(clingen, ['efo_ancestor_id', 'efo_ancestor_label'], keep_empty=True)
 
     clingen = clingen[['gene_id', 'gene_name', 'disease_label', 'mondo_disease_id', 'efo_ancestor_id', 'efo_ancestor_label']]
 
@@ -79,18 +92,15 @@ def main():
     clingen['gwas_association'] = np.where(clingen['l2g_score'] > 0.5, True, False)
     clingen = clingen.drop_duplicates(subset=['gene_id', 'gene_name', 'disease_label', 'mondo_disease_id', 'efo_ancestor_id', 'efo_ancestor_label', 'gwas_id_efo'])
 
-    clingen = clingen.groupby(
-    ['gene_id', 'gene_name', 'disease_label', 'mondo_disease_id', 'efo_ancestor_id', 'efo_ancestor_label']
-    ).agg(
-        gwas_association=('gwas_association', 'max'),
-        gwas_id_efo=('gwas_id_efo', lambda x: ';'.join(x.dropna().unique())),
-        gwas_label=('gwas_label', lambda x: ';'.join(x.dropna().unique())),
-        l2g_score=('l2g_score', lambda x: ';'.join(map(str, x.dropna().unique())))
-    ).reset_index()
+    keys = ['gene_id', 'gene_name', 'disease_label', 'mondo_disease_id', 'efo_ancestor_id', 'efo_ancestor_label']
+    gwas_association = clingen.groupby(keys, observed=True)['gwas_association'].max().to_numpy()
+    clingen = group_unique(clingen, keys, ['gwas_id_efo', 'gwas_label', 'l2g_score'])
+    clingen.insert(len(keys), 'gwas_association', gwas_association)
 
-    
-    clingen.to_csv('data/features/gwas_l2g.txt', sep='\t', index=False)
+    write_table(clingen, 'data/features/gwas_l2g', export_tsv=True)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    setup_logging()
+    main()
+    export_profile('data/profiles/gwas_l2g.json')
\ No newline at end of file
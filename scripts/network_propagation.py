@@ -0,0 +1,113 @@
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+
+from funcs.data import read_string_links, read_table, write_table
+from funcs.profiling import export_profile, logger, profiled, setup_logging
+
+def string_adjacency(string, channel='experimental'):
+    """
+    Build a column-normalised sparse transition matrix from a STRING edge list.
+
+    Parameters:
+        string: STRING edge list from read_string_links.
+        channel: evidence channel used as the edge weight (scaled to 0-1).
+
+    Returns (transition matrix as scipy CSR, protein IDs indexing its rows/columns).
+    """
+    string = string.loc[string[channel] > 0]
+    proteins = pd.Index(pd.unique(pd.concat([string['protein1'].astype(str), string['protein2'].astype(str)]))).sort_values()
+
+    rows = proteins.get_indexer(string['protein1'].astype(str))
+    cols = proteins.get_indexer(string['protein2'].astype(str))
+    weights = string[channel].to_numpy(np.float64) / 1000
+
+    # STRING lists both directions of each link; symmetrise in case a file does not
+    adjacency = sp.coo_matrix((weights, (rows, cols)), shape=(len(proteins), len(proteins))).tocsr()
+    adjacency = adjacency.maximum(adjacency.T)
+
+    degree = np.asarray(adjacency.sum(axis=0)).ravel()
+    degree[degree == 0] = 1
+    transition = adjacency @ sp.diags(1 / degree)
+
+    return transition.tocsr(), proteins
+
+def seed_matrix(proteins, strong_genes):
+    """
+    Build one restart vector per mondo_ancestor_id from the proteins of its strong genes.
+
+    Returns (dense proteins x ancestors matrix with columns summing to 1, ancestor IDs).
+    Ancestors with no seed protein in the network get an all-zero column.
+    """
+    seeds = strong_genes[['protein_id', 'mondo_ancestor_id']].dropna().drop_duplicates()
+    ancestors = pd.Index(seeds['mondo_ancestor_id'].unique()).sort_values()
+
+    rows = proteins.get_indexer(seeds['protein_id'])
+    cols = ancestors.get_indexer(seeds['mondo_ancestor_id'])
+    matrix = np.zeros((len(proteins), len(ancestors)))
+    matrix[rows[rows >= 0], cols[rows >= 0]] = 1
+
+    total = matrix.sum(axis=0)
+    total[total == 0] = 1
+    return matrix / total, ancestors
+
+def random_walk_with_restart(transition, seeds, restart=0.5, tol=1e-8, max_iter=100):
+    """
+    Random walk with restart (personalised PageRank) for all seed vectors at once.
+
+    Iterates P = (1 - restart) * W @ P + restart * P0, where W is the column-normalised
+    transition matrix and P0 holds one restart vector per column, so every ancestor is
+    solved by the same sparse-dense matrix product.
+    """
+    scores = seeds.copy()
+    for i in range(max_iter):
+        updated = (1 - restart) * (transition @ scores) + restart * seeds
+        change = np.abs(updated - scores).max() if scores.size else 0
+        scores = updated
+        if change < tol:
+            break
+    else:
+        logger.warning("Random walk did not converge after %d iterations (max change %.2e)", max_iter, change)
+    return scores
+
+@profiled
+def network_propagation_scores(string, strong_genes, channel='experimental', restart=0.5):
+    """
+    Score every protein in the STRING network against every mondo_ancestor_id.
+
+    Returns a long table of (protein_id, mondo_ancestor_id, rwr_score, network_seed), where
+    network_seed marks the strong-gene proteins used as restart nodes for that ancestor.
+    Seeds score highly against their own ancestor by construction.
+    """
+    transition, proteins = string_adjacency(string, channel=channel)
+    seeds, ancestors = seed_matrix(proteins, strong_genes)
+    scores = random_walk_with_restart(transition, seeds, restart=restart)
+
+    return pd.DataFrame({
+        'protein_id': np.repeat(proteins.to_numpy(), len(ancestors)),
+        'mondo_ancestor_id': np.tile(ancestors.to_numpy(), len(proteins)),
+        'rwr_score': scores.ravel(),
+        'network_seed': seeds.ravel() > 0,
+    })
+
+def main():
+    clingen = read_table('data/clingen.formatted')
+    clingen_strong = clingen.loc[clingen['classification'].isin(['Definitive', 'Strong', 'Moderate'])]
+
+    string = read_string_links('data/features/unformatted/9606.protein.links.detailed.v12.0.txt', channels=['experimental'],
+                               cache='data/features/unformatted/9606.protein.links.experimental.parquet')
+
+    scores = network_propagation_scores(string, clingen_strong)
+    write_table(scores, 'data/features/network_propagation.all_proteins')
+
+    clingen = clingen[['gene_id', 'gene_name', 'protein_id', 'mondo_disease_id', 'disease_label', 'mondo_ancestor_id', 'ancestor_label']].drop_duplicates()
+    clingen = clingen.merge(scores, on=['protein_id', 'mondo_ancestor_id'], how='left')
+    clingen['network_seed'] = clingen['network_seed'].fillna(False).astype(bool)
+
+    write_table(clingen, 'data/features/network_propagation', export_tsv=True)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+    export_profile('data/profiles/network_propagation.json')
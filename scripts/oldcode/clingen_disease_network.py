@@ -1,31 +1,18 @@
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
-from itertools import combinations
-import numpy as np
 
-clingen = pd.read_csv('data/formatteddata/clingen.gene_disease.txt', sep = '\t')
-clingen = clingen.drop_duplicates(subset = ['mondo_disease_id','ancestor_label'], keep = 'first')
-data = clingen[['mondo_disease_id', 'ancestor_label']].copy()
-data['ancestor_label'] = data['ancestor_label'].str.replace(' ','\n')
+from funcs.data import read_table
+from funcs.networks import ancestor_network, to_networkx
 
-# Group by disease and get sets of ancestors
-disease_to_ancestors = data.groupby('mondo_disease_id')['ancestor_label'].apply(set)
+clingen = read_table('data/clingen.formatted')
 
-# Create a dictionary to store edge weights
-edge_weights = {}
-
-# Iterate over diseases and find ancestor pairs
-for ancestors in disease_to_ancestors:
-    for pair in combinations(ancestors, 2):  # Get all pairs of ancestors per disease
-        edge_weights[pair] = edge_weights.get(pair, 0) + 1  # Increase weight by 1 per shared disease
+# Ancestor pairs weighted by the number of diseases they share (log(count + 1))
+edges = ancestor_network(clingen, by='mondo_disease_id', ancestor='ancestor_label')
+edges[['source', 'target']] = edges[['source', 'target']].apply(lambda x: x.str.replace(' ', '\n'))
 
 # Create the graph
-G = nx.Graph()
-
-# Add edges with weights
-for (a1, a2), weight in edge_weights.items():
-    G.add_edge(a1, a2, weight=np.log(weight + 1))
+G = to_networkx(edges, weight='log_weight')
 G.remove_nodes_from(list(nx.isolates(G)))
 # Positioning using spring layout
 pos = nx.spring_layout(G, seed = 42, k = 3, weight = 'weights')
@@ -1,5 +1,5 @@
 import pandas as pd
-from funcs.data_formatting import mondo_to_ontology, ontology_to_disease_gene, read_and_explode_chembl, read_and_explode_opentargets, format_protein_data
+from funcs.data_formatting import mondo_to_ontology, ontology_to_disease_gene, read_and_explode_chembl, read_opentargets_expression, format_protein_data
 import os
 import ast
 
@@ -40,14 +40,11 @@ chembl_df = ontology_to_disease_gene(clingen_df, ont_mapper, chembl_df, phenotyp
 chembl_df.to_csv(os.path.join(features, 'formatted', 'chembl.txt'), sep = '\t', index = False)
 
 #Add tissue expression data
-opentargets_rnavalue = read_and_explode_opentargets(os.path.join(features, 'unformatted', 'opentargets','baselineExpression.csv'), 'rna.value', mapper, clingen_df)
-opentargets_rnavalue.to_csv(os.path.join(features, 'formatted', 'rnaexpression.txt'), sep = '\t', index = False)
+expression = read_opentargets_expression(os.path.join(features, 'unformatted', 'opentargets','baselineExpression.csv'), ['rna.value', 'protein.level', 'rna.zscore'], mapper, clingen_df)
 
-opentargets_proteinvalue = read_and_explode_opentargets(os.path.join(features, 'unformatted', 'opentargets','baselineExpression.csv'), 'protein.level', mapper, clingen_df)
-opentargets_proteinvalue.to_csv(os.path.join(features, 'formatted', 'proteinexpression.txt'), sep = '\t', index = False)
-
-opentargets_rnaspecificity = read_and_explode_opentargets(os.path.join(features, 'unformatted', 'opentargets','baselineExpression.csv'), 'rna.zscore', mapper, clingen_df)
-opentargets_rnaspecificity.to_csv(os.path.join(features, 'formatted', 'rnaspecificity.txt'), sep = '\t', index = False)
+expression['rna.value'].to_csv(os.path.join(features, 'formatted', 'rnaexpression.txt'), sep = '\t', index = False)
+expression['protein.level'].to_csv(os.path.join(features, 'formatted', 'proteinexpression.txt'), sep = '\t', index = False)
+expression['rna.zscore'].to_csv(os.path.join(features, 'formatted', 'rnaspecificity.txt'), sep = '\t', index = False)
 
 #Add protein data
 protein_score, protein_df = format_protein_data(os.path.join(features, 'unformatted', '9606.protein.physical.links.detailed.v12.0.txt'), clingen_df)
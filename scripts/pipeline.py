@@ -0,0 +1,263 @@
+import argparse
+import concurrent.futures
+import hashlib
+import importlib
+import json
+import os
+
+from funcs.profiling import export_profile, reset_profile, setup_logging
+
+# Each step runs the main() of a script. Inputs and outputs must match the paths
+# hard-coded in that script's main(); a step depends on every step that produces
+# one of its inputs. Folders are hashed file by file. `code` lists the scripts a
+# step runs or imports (funcs/ is always included), so editing any of them reruns it.
+STEPS = [
+    {'name': 'clingen', 'module': 'clingen_data_formatting',
+     'code': ['clingen_data_formatting.py'],
+     'inputs': ['data/rawdata/Clingen-Gene-Disease-Summary-2025-08-20.csv',
+                'data/rawdata/ensembl/'],
+     'outputs': ['data/clingen.formatted.parquet',
+                 'data/ensembl.genes.parquet',
+                 'data/ontology_mapping.starter.txt']},
+    {'name': 'gwas_l2g', 'module': 'gwas_l2g',
+     'code': ['gwas_l2g.py'],
+     'inputs': ['data/clingen.formatted.parquet',
+                'data/ontology_mapping.manualedits.txt',
+                'data/opentargets/study/study/',
+                'data/opentargets/credible_set/credible_set/',
+                'data/opentargets/l2g_predictor/l2g_prediction/'],
+     'outputs': ['data/opentargets_formatted/l2g.parquet',
+                 'data/features/gwas_l2g.parquet']},
+    {'name': 'mouse', 'module': 'mouse',
+     'code': ['mouse.py'],
+     'inputs': ['data/clingen.formatted.parquet',
+                'data/ontology_mapping.manualedits.txt',
+                'data/opentargets/mouse_phenotype/'],
+     'outputs': ['data/features/mouse.parquet']},
+    {'name': 'protein_links', 'module': 'protein_links',
+     'code': ['protein_links.py'],
+     'inputs': ['data/clingen.formatted.parquet',
+                'data/features/unformatted/9606.protein.links.detailed.v12.0.txt'],
+     'outputs': ['data/features/protein_links.parquet']},
+    {'name': 'network_propagation', 'module': 'network_propagation',
+     'code': ['network_propagation.py'],
+     'inputs': ['data/clingen.formatted.parquet',
+                'data/features/unformatted/9606.protein.links.detailed.v12.0.txt'],
+     'outputs': ['data/features/network_propagation.all_proteins.parquet',
+                 'data/features/network_propagation.parquet']},
+    {'name': 'feature_matrix', 'module': 'feature_matrix',
+     'code': ['feature_matrix.py', 'mouse.py'],
+     'inputs': ['data/ensembl.genes.parquet',
+                'data/clingen.formatted.parquet',
+                'data/ontology_mapping.manualedits.txt',
+                'data/opentargets_formatted/l2g.parquet',
+                'data/opentargets/mouse_phenotype/',
+                'data/features/network_propagation.all_proteins.parquet'],
+     'outputs': ['data/features/feature_matrix.parquet']},
+    {'name': 'train_models', 'module': 'train_models', 'params': {'argv': []},
+     'code': ['train_models.py'],
+     'inputs': ['data/features/feature_matrix.parquet'],
+     'outputs': ['data/models/logistic.scores.parquet',
+                 'data/models/logistic.models.pkl',
+                 'data/models/logistic.cv_metrics.txt']},
+]
+
+STATE_FILE = 'data/.pipeline_state.json'
+PROFILE_DIR = 'data/profiles'
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'files': {}, 'steps': {}}
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+def hash_file(path, state):
+    '''
+    Content hash of a file. Hashes are remembered against the file's size and
+    modification time, so unchanged multi-GB inputs are only read once.
+    '''
+    stat = os.stat(path)
+    cached = state['files'].get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    state['files'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+def hash_path(path, state, suffix=''):
+    '''
+    Content hash of a file, or of every file under a folder whose name ends with
+    `suffix` (e.g. '.py' for source folders). __pycache__ folders are skipped, since
+    importing a module rewrites its bytecode.
+    '''
+    if os.path.isfile(path):
+        return hash_file(path, state)
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(folder for folder in dirs if folder != '__pycache__')
+        for file in sorted(f for f in files if f.endswith(suffix)):
+            filepath = os.path.join(root, file)
+            digest.update(f'{os.path.relpath(filepath, path)}\0{hash_file(filepath, state)}\0'.encode())
+    return digest.hexdigest()
+
+def step_key(step, state):
+    '''
+    Hash of everything a step's outputs depend on: its inputs, parameters, and the
+    source of the scripts in its `code` list and of funcs/.
+    '''
+    code = [os.path.join(SCRIPTS_DIR, file) for file in step.get('code', [f"{step['module']}.py"])]
+    code.append(os.path.join(SCRIPTS_DIR, 'funcs'))
+    digest = hashlib.sha256(json.dumps(step.get('params', {}), sort_keys=True).encode())
+    for path in step['inputs']:
+        digest.update(f'{path}\0{hash_path(path, state)}\0'.encode())
+    for path in code:
+        digest.update(f'{path}\0{hash_path(path, state, suffix=".py")}\0'.encode())
+    return digest.hexdigest()
+
+def dependencies(steps):
+    '''
+    Map each step name to the names of the steps producing its inputs.
+    '''
+    producers = {os.path.normpath(output): step['name'] for step in steps for output in step['outputs']}
+    return {step['name']: {producers[os.path.normpath(path)] for path in step['inputs']
+                           if os.path.normpath(path) in producers and producers[os.path.normpath(path)] != step['name']}
+            for step in steps}
+
+def select_steps(steps, targets):
+    '''
+    Restrict the pipeline to the target steps and everything upstream of them.
+    '''
+    if not targets:
+        return steps
+    depends = dependencies(steps)
+    unknown = set(targets) - set(depends)
+    if unknown:
+        raise ValueError(f"Unknown pipeline steps: {sorted(unknown)}")
+
+    selected, to_process = set(), list(targets)
+    while to_process:
+        name = to_process.pop()
+        if name not in selected:
+            selected.add(name)
+            to_process.extend(depends[name])
+    return [step for step in steps if step['name'] in selected]
+
+def run_step(module, params):
+    '''
+    Run a step's main() in a worker process and save its per-function profile
+    (timings, memory and row counts) to data/profiles/<module>.json.
+    '''
+    setup_logging()
+    reset_profile()
+    importlib.import_module(module).main(**params)
+    export_profile(os.path.join(PROFILE_DIR, f'{module}.json'))
+
+def is_up_to_date(step, state):
+    missing = [path for path in step['inputs'] if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Step '{step['name']}' is missing inputs: {missing}")
+    if not all(os.path.exists(path) for path in step['outputs']):
+        return False
+    return state['steps'].get(step['name']) == step_key(step, state)
+
+def run_pipeline(steps=STEPS, targets=None, force=False, dry_run=False, max_workers=None):
+    '''
+    Run the pipeline, skipping steps whose inputs, parameters and code are unchanged
+    since their outputs were last built. Independent steps run concurrently in a
+    process pool; a step starts as soon as all of its upstream steps have finished.
+
+    Returns a dict of step name -> 'skipped', 'ran', 'would run', 'failed' or 'blocked'.
+    '''
+    steps = select_steps(steps, targets)
+    depends = dependencies(steps)
+    by_name = {step['name']: step for step in steps}
+    state = load_state()
+    status = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while len(status) < len(steps):
+            progress = len(status)
+            for name, step in by_name.items():
+                if name in status or name in running.values():
+                    continue
+                upstream = [status.get(dep) for dep in depends[name]]
+                if any(s in ('failed', 'blocked') for s in upstream):
+                    status[name] = 'blocked'
+                    print(f"[{name}] not run: an upstream step failed")
+                    continue
+                if any(s is None for s in upstream):
+                    continue
+
+                # Upstream outputs are hashed like any other input, so a rebuilt step whose
+                # outputs did not change does not trigger its downstream steps
+                rerun = force or any(s == 'would run' for s in upstream)
+                try:
+                    up_to_date = is_up_to_date(step, state)
+                except FileNotFoundError as e:
+                    if dry_run and rerun:
+                        up_to_date = False
+                    else:
+                        status[name] = 'failed'
+                        print(f"[{name}] {e}")
+                        continue
+
+                if up_to_date and not rerun:
+                    status[name] = 'skipped'
+                    print(f"[{name}] up to date")
+                elif dry_run:
+                    status[name] = 'would run'
+                    print(f"[{name}] would run")
+                else:
+                    print(f"[{name}] running {step['module']}.main()")
+                    running[pool.submit(run_step, step['module'], step.get('params', {}))] = name
+
+            if not running:
+                if len(status) == progress:
+                    raise ValueError(f"Pipeline steps form a cycle: {sorted(set(by_name) - set(status))}")
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    status[name] = 'failed'
+                    print(f"[{name}] failed: {e!r}")
+                    continue
+                status[name] = 'ran'
+                # Outputs are rebuilt, so hash the inputs again in case the step touched them
+                state['steps'][name] = step_key(by_name[name], state)
+                save_state(state)
+                print(f"[{name}] done")
+
+    save_state(state)
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the feature pipeline, rebuilding only out of date steps. Run from the repository root.')
+    parser.add_argument('steps', nargs='*', help='steps to build (with their upstream steps); default is all: ' +
+                        ', '.join(step['name'] for step in STEPS))
+    parser.add_argument('--force', action='store_true', help='rerun steps even if they are up to date')
+    parser.add_argument('--dry-run', action='store_true', help='report which steps would run without running them')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of steps to run at once')
+    args = parser.parse_args()
+
+    status = run_pipeline(targets=args.steps, force=args.force, dry_run=args.dry_run, max_workers=args.workers)
+    if any(s in ('failed', 'blocked') for s in status.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
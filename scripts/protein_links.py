@@ -1,47 +1,94 @@
 import pandas as pd
 
-def get_protein_links(path, clingen, strong_genes, experimental_protein_link_threshold=400):
+from funcs.data import read_string_links, read_table, write_table
+from funcs.profiling import export_profile, log_table, profiled, setup_logging
+
+def _join_unique(links, keys, column):
+    """
+    Join the unique values of a column per key with ';', in order of first appearance.
+    """
+    values = links[keys + [column]].dropna().drop_duplicates()
+    values[column] = values[column].astype(str)
+    return values.groupby(keys, sort=False, observed=True)[column].agg(';'.join)
+
+@profiled
+def protein_link_features(string, clingen, strong_genes, channels=None):
+    """
+    Compute protein link features for every (gene, mondo_ancestor_id) pair in one pass.
+
+    A gene is linked to an ancestor if one of its proteins has a STRING link with
+    evidence > 0 to a protein of a strong gene for that ancestor.
+
+    Parameters:
+        string: STRING edge list from read_string_links, with protein1 (the strong gene
+            protein), protein2 and one column per evidence channel.
+        clingen: gene-disease rows to annotate (gene_id, gene_name, protein_id, mondo_ancestor_id).
+        strong_genes: gene-disease rows whose proteins seed each ancestor.
+        channels: evidence channel -> threshold. The first channel gives the
+            `evidence_strength` column; any others are prefixed with the channel name.
+            Defaults to {'experimental': 400}.
+
+    Returns clingen with, per channel, `<channel>_protein_link` (max evidence > threshold) and the
+    evidence strength, plus `linked_protein_ids` and `linked_protein_names` for links with any
+    evidence in the given channels. Values are ';'-joined and unique.
+    """
+    channels = dict(channels or {'experimental': 400})
+    keys = ['gene_id', 'mondo_ancestor_id']
+
+    seeds = strong_genes[['protein_id', 'mondo_ancestor_id']].dropna().drop_duplicates()
+    seeds = seeds.rename(columns = {'protein_id': 'linked_protein_id'})
+    targets = clingen[['gene_id', 'protein_id', 'mondo_ancestor_id']].dropna().drop_duplicates()
+    names = clingen[['protein_id', 'gene_name']].dropna().drop_duplicates()
+    names = names.rename(columns = {'protein_id': 'linked_protein_id', 'gene_name': 'linked_protein_name'})
+
+    links = string.rename(columns = {'protein1': 'linked_protein_id', 'protein2': 'protein_id'})
+    links = links.astype({'linked_protein_id': str, 'protein_id': str})
+    links = links.loc[(links[list(channels)] > 0).any(axis=1)]
+
+    # Link -> seed ancestor -> gene row of the same ancestor
+    links = links.merge(seeds, on = 'linked_protein_id', how = 'inner')
+    links = links.merge(targets, on = ['protein_id', 'mondo_ancestor_id'], how = 'inner')
+    links = links.merge(names, on = 'linked_protein_id', how = 'left')
+
+    features = pd.DataFrame(index = links[keys].drop_duplicates().set_index(keys).index)
+    for i, (channel, threshold) in enumerate(channels.items()):
+        channel_links = links.loc[links[channel] > 0]
+        strength = 'evidence_strength' if i == 0 else f'{channel}_evidence_strength'
+        features[f'{channel}_protein_link'] = channel_links.groupby(keys, observed=True)[channel].max() > threshold
+        features[strength] = _join_unique(channel_links, keys, channel)
+    features['linked_protein_ids'] = _join_unique(links, keys, 'linked_protein_id')
+    features['linked_protein_names'] = _join_unique(links, keys, 'linked_protein_name')
+
+    link_columns = [f'{channel}_protein_link' for channel in channels]
+    columns = link_columns + ['linked_protein_ids', 'linked_protein_names', 'evidence_strength'] + \
+              [f'{channel}_evidence_strength' for channel in list(channels)[1:]]
+
+    clingen = clingen.drop(columns = [column for column in columns if column in clingen.columns])
+    clingen = clingen.merge(features[columns].reset_index(), on = keys, how = 'left')
+    clingen[link_columns] = clingen[link_columns].fillna(False).astype(bool)
+
+    return clingen
+
+@profiled
+def get_protein_links(path, clingen, strong_genes, experimental_protein_link_threshold=400, cache=None, channels=None):
     """
     Get protein links from a file and filter them based on strong genes from ClinGen data.
     
-    Parameters:"""
-
-    string = pd.read_csv(path, sep='\s+')
-    print(string.head())
-    string['protein1'] = string['protein1'].str.split('.').str[1]
-    string['protein2'] = string['protein2'].str.split('.').str[1]
-    string = string.merge(clingen[['gene_id', 'gene_name', 'protein_id']], left_on='protein1', right_on='protein_id', how='left')
-    string.rename(columns = {'gene_id': 'linked_gene_id', 'gene_name': 'linked_gene_name', 'protein_id': 'linked_protein_id'}, inplace=True)
-    string = string.merge(clingen[['gene_id', 'gene_name', 'protein_id']], left_on='protein2', right_on='protein_id', how='left')
-
-    string = string.dropna(subset=['linked_gene_id', 'linked_gene_name', 'linked_protein_id'])
-
-    clingen['experimental_protein_link'] = False
-    clingen['linked_protein_ids'] = None
-    clingen['linked_protein_names'] = None
-    clingen['evidence_strength'] = None
-
-    for ancestor in clingen['mondo_ancestor_id'].unique():
-        clingen_subset = clingen[clingen['mondo_ancestor_id'] == ancestor]
-        strong_genes_subset = strong_genes[strong_genes['mondo_ancestor_id'] == ancestor]
-
-        # Filter STRING interactions for the current ancestor
-        string_subset = string[(string['linked_protein_id'].isin(strong_genes_subset['protein_id'])) &
-                               (string['experimental'] > 0)]
-        
-        for i,row in clingen_subset.iterrows():
-            gene_interactions = string_subset[string_subset['protein_id'] == row['protein_id']]
-            print(gene_interactions.head(), gene_interactions.columns)
-
-
-            if gene_interactions.empty:
-                continue
-            if gene_interactions['experimental'].max() > experimental_protein_link_threshold:
-                clingen.loc[((clingen['gene_id'] == row['gene_id']) & (clingen['mondo_ancestor_id'] == ancestor)), 'experimental_protein_link'] = True
-            clingen.loc[((clingen['gene_id'] == row['gene_id']) & (clingen['mondo_ancestor_id'] == ancestor)), 'linked_protein_ids'] = ';'.join(gene_interactions['linked_protein_id'].unique())
-            clingen.loc[((clingen['gene_id'] == row['gene_id']) & (clingen['mondo_ancestor_id'] == ancestor)), 'linked_protein_names'] = ';'.join(gene_interactions['linked_gene_name'].unique())
-            clingen.loc[((clingen['gene_id'] == row['gene_id']) & (clingen['mondo_ancestor_id'] == ancestor)), 'evidence_strength'] = ';'.join(gene_interactions['experimental'].astype(str).unique())
-        
+    Parameters:
+        path: STRING protein links (detailed) file.
+        clingen: gene-disease rows to annotate.
+        strong_genes: gene-disease rows used as seeds for each mondo_ancestor_id.
+        experimental_protein_link_threshold: experimental score for a link to count as moderate evidence.
+        cache: optional parquet path for the filtered STRING edge list.
+        channels: optional dict of evidence channel -> threshold, replacing the experimental default.
+    """
+    if channels is None:
+        channels = {'experimental': experimental_protein_link_threshold}
+
+    #only links between ClinGen proteins are needed, so filter while streaming the file
+    string = read_string_links(path, protein_ids=clingen['protein_id'], channels=list(channels), cache=cache)
+
+    clingen = protein_link_features(string, clingen, strong_genes, channels=channels)
     clingen = clingen.drop_duplicates(keep = 'first')
     return clingen
 
@@ -49,15 +96,18 @@ def get_protein_links(path, clingen, strong_genes, experimental_protein_link_thr
         
 
 def main():
-    clingen = pd.read_csv('data/clingen.formatted.txt', sep='\t')
+    clingen = read_table('data/clingen.formatted')
     clingen_strong = clingen.loc[clingen['classification'].isin(['Definite', 'Strong', 'Moderate'])]
     cligen_strong = clingen_strong[['gene_id', 'gene_name', 'protein_id', 'mondo_disease_id', 'disease_label', 'mondo_ancestor_id', 'ancestor_label']].drop_duplicates()
 
-    protein_links = get_protein_links('data/features/unformatted/9606.protein.links.detailed.v12.0.txt', cligen_strong, clingen)
+    protein_links = get_protein_links('data/features/unformatted/9606.protein.links.detailed.v12.0.txt', cligen_strong, clingen,
+                                      cache='data/features/unformatted/9606.protein.links.clingen.parquet')
 
-    print(protein_links.head())
-    protein_links.to_csv('data/features/protein_links.txt', sep='\t', index=False)
+    log_table('Protein links', protein_links)
+    write_table(protein_links, 'data/features/protein_links', export_tsv=True)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    setup_logging()
+    main()
+    export_profile('data/profiles/protein_links.json')
@@ -0,0 +1,325 @@
+import argparse
+import functools
+import glob
+import json
+import os
+import sys
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from funcs.data import read_table
+from funcs.ontology_index import closure_ancestors, load_closure_index
+from funcs.profiling import logger, profiled, setup_logging
+from train_models import MODEL_DIR, load_models
+
+def _value(value):
+    '''
+    JSON-safe Python value of a numpy scalar (NaN becomes None).
+    '''
+    value = value.item() if hasattr(value, 'item') else value
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+SCORE_COLUMNS = {'organ': 'organ_model_score', 'pooled': 'pooled_model_score', 'cross_validation': 'cross_validation_score'}
+
+class ScoringService:
+    '''
+    In-memory gene prioritisation scores, loaded once and queried many times.
+
+    Holds the feature matrix and model scores (data/features/feature_matrix and
+    data/models/<model>.scores) as gene x ancestor arrays, a gene ID / symbol /
+    protein ID crosswalk (data/ensembl.genes), and optionally the MONDO closure index
+    so any MONDO disease can be used as the organ system query. Results of recent
+    queries are kept in an LRU cache.
+    '''
+    def __init__(self, matrix, scores=None, models=None, ensembl=None, closure=None, cache_size=4096):
+        self.genes = pd.Index(matrix['gene_id'].cat.categories.astype(str))
+        self.ancestors = pd.Index(matrix['mondo_ancestor_id'].cat.categories.astype(str))
+        shape = (len(self.genes), len(self.ancestors))
+
+        names = matrix[['gene_id', 'gene_name']].drop_duplicates(subset=['gene_id'])
+        self.gene_names = pd.Series(names['gene_name'].astype(str).to_numpy(), index=names['gene_id'].astype(str).to_numpy()).reindex(self.genes).to_numpy()
+        labels = matrix[['mondo_ancestor_id', 'ancestor_label']].drop_duplicates(subset=['mondo_ancestor_id'])
+        self.ancestor_labels = pd.Series(labels['ancestor_label'].astype(str).to_numpy(), index=labels['mondo_ancestor_id'].astype(str).to_numpy()).reindex(self.ancestors).to_numpy()
+
+        self.features = {column: matrix[column].to_numpy().reshape(shape) for column in matrix.columns
+                         if column not in ('gene_id', 'gene_name', 'mondo_ancestor_id', 'ancestor_label')}
+
+        # scores are written by train_models in feature matrix (gene-major) order
+        self.scores = {}
+        if scores is not None:
+            cells = self._cells(scores['gene_id'], scores['mondo_ancestor_id'])
+            for name, column in SCORE_COLUMNS.items():
+                values = np.full(shape[0] * shape[1], np.nan, dtype=np.float32)
+                values[cells[cells >= 0]] = scores[column].to_numpy(np.float32)[cells >= 0]
+                self.scores[name] = values.reshape(shape)
+        self.ranks = {name: self._percentiles(values) for name, values in self.scores.items()}
+
+        self.models = models
+        self.closure = closure
+        self.crosswalk = self._crosswalk(ensembl)
+
+        self.score = functools.lru_cache(maxsize=cache_size)(self._score)
+        self.explain = functools.lru_cache(maxsize=cache_size)(self._explain)
+
+    def _cells(self, gene_ids, ancestor_ids):
+        gene_codes = self.genes.get_indexer(pd.Series(gene_ids).astype(str))
+        ancestor_codes = self.ancestors.get_indexer(pd.Series(ancestor_ids).astype(str))
+        return np.where((gene_codes >= 0) & (ancestor_codes >= 0), gene_codes * len(self.ancestors) + ancestor_codes, -1)
+
+    @staticmethod
+    def _percentiles(values):
+        '''
+        Percentile (0-100, higher is better) of each gene's score within its ancestor.
+        '''
+        ranks = pd.DataFrame(values).rank(axis=0, pct=True).to_numpy()
+        return np.round(ranks * 100, 2)
+
+    def _crosswalk(self, ensembl):
+        '''
+        Upper-cased gene ID, symbol and protein ID -> gene_id.
+        '''
+        keys = [pd.Series(self.genes, index=self.genes), pd.Series(self.genes, index=self.gene_names)]
+        if ensembl is not None:
+            for column in ['gene_name', 'protein_id', 'transcript_id']:
+                if column in ensembl.columns:
+                    pairs = ensembl[[column, 'gene_id']].dropna().astype(str)
+                    keys.append(pd.Series(pairs['gene_id'].to_numpy(), index=pairs[column].to_numpy()))
+        crosswalk = pd.concat(keys)
+        crosswalk.index = crosswalk.index.str.upper()
+        return crosswalk[~crosswalk.index.duplicated(keep='first')].to_dict()
+
+    def resolve_genes(self, genes):
+        '''
+        gene_ids for gene IDs, symbols or protein IDs (case-insensitive); unknown queries map to None.
+        '''
+        return {gene: self.crosswalk.get(str(gene).strip().upper()) for gene in genes}
+
+    def resolve_organ(self, organ):
+        '''
+        Ancestor codes for an organ system given as a mondo_ancestor_id, its label, or (with
+        the MONDO closure index) any MONDO disease under one or more organ systems.
+        '''
+        organ = str(organ).strip().replace(':', '_')
+        code = self.ancestors.get_indexer([organ])[0]
+        if code >= 0:
+            return [code]
+        matches = np.flatnonzero(np.char.lower(self.ancestor_labels.astype(str)) == organ.lower())
+        if len(matches):
+            return matches.tolist()
+        if self.closure is not None and organ.upper().startswith('MONDO_'):
+            ancestors = closure_ancestors(self.closure, [organ.upper()], names=False)['Ontology ID']
+            codes = self.ancestors.get_indexer(ancestors)
+            return sorted(set(codes[codes >= 0].tolist()))
+        return []
+
+    def organs(self):
+        return [{'mondo_ancestor_id': ancestor, 'ancestor_label': label} for ancestor, label in zip(self.ancestors, self.ancestor_labels)]
+
+    def _score(self, genes, organ, model='organ'):
+        '''
+        Scores of `genes` (a tuple) for one organ system, one record per gene and matching
+        ancestor, best score first. Genes that are not found are returned with found=False.
+        '''
+        if model not in self.scores:
+            raise ValueError(f"No {model} scores loaded; run train_models.py first")
+        codes = self.resolve_organ(organ)
+        if not codes:
+            raise ValueError(f"Unknown organ system: {organ}")
+
+        resolved = self.resolve_genes(genes)
+        records = [{'query': query, 'found': False} for query, gene_id in resolved.items() if gene_id is None]
+        found = [(query, gene_id) for query, gene_id in resolved.items() if gene_id is not None]
+        gene_codes = self.genes.get_indexer([gene_id for _, gene_id in found])
+
+        label = self.features.get('clingen_label')
+        for code in codes:
+            scores = self.scores[model][gene_codes, code]
+            ranks = self.ranks[model][gene_codes, code]
+            for (query, gene_id), gene, score, rank in zip(found, gene_codes, scores, ranks):
+                records.append({'query': query, 'found': True, 'gene_id': gene_id, 'gene_name': self.gene_names[gene],
+                                'mondo_ancestor_id': self.ancestors[code], 'ancestor_label': self.ancestor_labels[code],
+                                'score': _value(round(float(score), 6)), 'percentile': _value(rank),
+                                'clingen_label': None if label is None else int(label[gene, code])})
+        return tuple(sorted(records, key=lambda record: (record.get('score') is None, -(record.get('score') or 0))))
+
+    def score_batch(self, queries):
+        '''
+        Answer many {'genes': [...], 'organ': ..., 'model': ...} queries; results are in the
+        same order, with an 'error' entry for queries that fail.
+        '''
+        results = []
+        for query in queries:
+            try:
+                results.append({'query': query, 'results': list(self.score(tuple(query['genes']), query['organ'], query.get('model', 'organ')))})
+            except KeyError as e:
+                results.append({'query': query, 'error': f'Missing parameter: {e.args[0]}'})
+            except ValueError as e:
+                results.append({'query': query, 'error': str(e)})
+        return results
+
+    def _contributions(self, values, ancestor):
+        '''
+        Per-feature contributions to the logistic model's log-odds (coefficient x
+        standardised value), for the organ-system model of `ancestor`.
+        '''
+        if not self.models:
+            return None
+        model = self.models['models'].get(ancestor)
+        if model is None or not hasattr(model, 'named_steps'):
+            return None
+        scaler, classifier = model.named_steps['standardscaler'], model.named_steps['logisticregression']
+        x = (np.array([np.nan if value is None else value for value in values], dtype=float) - scaler.mean_) / scaler.scale_
+        return {feature: round(float(value), 4) for feature, value in zip(self.models['features'], x * classifier.coef_[0])}
+
+    def _explain(self, gene, organ=None):
+        '''
+        Feature values, scores and (for logistic models) feature contributions of one gene,
+        for one organ system or all of them.
+        '''
+        gene_id = self.resolve_genes([gene])[gene]
+        if gene_id is None:
+            raise ValueError(f"Unknown gene: {gene}")
+        codes = self.resolve_organ(organ) if organ is not None else range(len(self.ancestors))
+        if organ is not None and not codes:
+            raise ValueError(f"Unknown organ system: {organ}")
+
+        g = self.genes.get_loc(gene_id)
+        rows = []
+        for code in codes:
+            features = {name: _value(values[g, code]) for name, values in self.features.items()}
+            row = {'mondo_ancestor_id': self.ancestors[code], 'ancestor_label': self.ancestor_labels[code], 'features': features,
+                   'scores': {name: _value(round(float(values[g, code]), 6)) for name, values in self.scores.items()}}
+            if self.models:
+                row['contributions'] = self._contributions([features[feature] for feature in self.models['features']], self.ancestors[code])
+            rows.append(row)
+        return {'gene_id': gene_id, 'gene_name': self.gene_names[g], 'organs': rows}
+
+@profiled
+def load_service(model='logistic', closure=None, cache_size=4096):
+    '''
+    Load the feature matrix, model scores and models, the Ensembl crosswalk and the
+    newest cached MONDO closure index (unless `closure` gives a path).
+    '''
+    matrix = read_table('data/features/feature_matrix')
+    scores_path = os.path.join(MODEL_DIR, f'{model}.scores')
+    scores = read_table(scores_path) if os.path.exists(f'{scores_path}.parquet') else None
+    models_path = os.path.join(MODEL_DIR, f'{model}.models.pkl')
+    models = load_models(models_path) if os.path.exists(models_path) else None
+    ensembl = read_table('data/ensembl.genes') if os.path.exists('data/ensembl.genes.parquet') else None
+
+    if closure is None:
+        cached = sorted(glob.glob('data/ontology_lookups/closure/mondo.*.closure.npz'), key=os.path.getmtime)
+        closure = cached[-1] if cached else None
+    closure = load_closure_index(closure) if closure else None
+
+    return ScoringService(matrix, scores=scores, models=models, ensembl=ensembl, closure=closure, cache_size=cache_size)
+
+def make_handler(service):
+    '''
+    HTTP request handler answering JSON queries from a loaded ScoringService:
+    - GET /health, GET /organs
+    - GET /score?genes=BRCA1,TP53&organ=MONDO_0045024&model=organ
+    - POST /score with {"genes": [...], "organ": ...} or {"queries": [{...}, ...]}
+    - GET /explain?gene=BRCA1&organ=MONDO_0045024 (organ optional)
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _answer(self, handler):
+            start = time.perf_counter()
+            try:
+                status, body = 200, handler()
+            except KeyError as e:
+                status, body = 400, {'error': f'Missing parameter: {e.args[0]}'}
+            except ValueError as e:
+                status, body = 400, {'error': str(e)}
+            except Exception as e:
+                logger.exception('Error answering %s', self.path)
+                status, body = 500, {'error': repr(e)}
+            self._send(status, body)
+            logger.debug('%s %s %d in %.1f ms', self.command, self.path, status, (time.perf_counter() - start) * 1000)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+            routes = {
+                '/health': lambda: {'genes': len(service.genes), 'organs': len(service.ancestors), 'models': sorted(service.scores),
+                                    'cache': service.score.cache_info()._asdict()},
+                '/organs': service.organs,
+                '/score': lambda: list(service.score(tuple(params['genes'].split(',')), params['organ'], params.get('model', 'organ'))),
+                '/explain': lambda: service.explain(params['gene'], params.get('organ')),
+            }
+            if url.path not in routes:
+                return self._send(404, {'error': f'Unknown path {url.path}'})
+            self._answer(routes[url.path])
+
+        def do_POST(self):
+            if urllib.parse.urlparse(self.path).path != '/score':
+                return self._send(404, {'error': f'Unknown path {self.path}'})
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self._answer(lambda: service.score_batch(body['queries'] if 'queries' in body else [body]))
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return Handler
+
+def serve(service, host='127.0.0.1', port=8000):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logger.info('Serving %d genes x %d organ systems on http://%s:%d', len(service.genes), len(service.ancestors), host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score genes for organ systems from the trained models. Run from the repository root.')
+    parser.add_argument('--model', default='logistic', help='trained model whose scores to load (see train_models.py)')
+    parser.add_argument('--closure', default=None, help='MONDO closure index (.npz); default is the newest cached one')
+    parser.add_argument('--cache-size', type=int, default=4096, help='number of recent queries to keep')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server = commands.add_parser('serve', help='run the HTTP API')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8000)
+
+    score = commands.add_parser('score', help='score genes for an organ system')
+    score.add_argument('organ', help='mondo_ancestor_id, organ system label or MONDO disease ID')
+    score.add_argument('genes', nargs='*', help='gene IDs, symbols or protein IDs')
+    score.add_argument('--genes-file', help='file with one gene per line')
+    score.add_argument('--score', choices=sorted(SCORE_COLUMNS), default='organ', help='which model score to report')
+
+    explain = commands.add_parser('explain', help='feature values and scores of one gene')
+    explain.add_argument('gene')
+    explain.add_argument('--organ', default=None)
+
+    args = parser.parse_args(argv)
+    service = load_service(model=args.model, closure=args.closure, cache_size=args.cache_size)
+
+    if args.command == 'serve':
+        serve(service, host=args.host, port=args.port)
+    elif args.command == 'score':
+        genes = list(args.genes)
+        if args.genes_file:
+            with open(args.genes_file) as f:
+                genes += [line.strip() for line in f if line.strip()]
+        pd.DataFrame(service.score(tuple(genes), args.organ, args.score)).to_csv(sys.stdout, sep='\t', index=False)
+    else:
+        print(json.dumps(service.explain(args.gene, args.organ), indent=1))
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
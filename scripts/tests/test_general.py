@@ -0,0 +1,30 @@
+import os
+import sys
+
+# Tests import funcs/ from the scripts folder, like the pipeline scripts
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import numpy as np
+import pandas as pd
+
+from funcs.general import explode_list_columns, list_column
+
+def test_explode_null_list_cell():
+    # a left merge onto the ontology mapping leaves null list cells for unmapped rows
+    lookup = pd.DataFrame({'mondo_ancestor_id': ['MONDO_1'],
+                           'mp_ancestor_id': list_column(pd.Series(['MP_1; MP_2'])),
+                           'mp_ancestor_label': list_column(pd.Series(['muscle; skeleton']))})
+    clingen = pd.DataFrame({'gene_id': ['G1', 'G2'], 'mondo_ancestor_id': ['MONDO_1', np.nan]})
+    merged = clingen.merge(lookup, on='mondo_ancestor_id', how='left')
+    assert merged['mp_ancestor_id'].isna().iloc[1]
+
+    kept = explode_list_columns(merged, ['mp_ancestor_id', 'mp_ancestor_label'], keep_empty=True)
+    assert kept['gene_id'].tolist() == ['G1', 'G1', 'G2']
+    assert kept['mp_ancestor_id'].iloc[:2].tolist() == ['MP_1', 'MP_2']
+    assert kept['mp_ancestor_label'].iloc[:2].tolist() == ['muscle', 'skeleton']
+    assert kept['mp_ancestor_id'].isna().iloc[2] and kept['mp_ancestor_label'].isna().iloc[2]
+
+    dropped = explode_list_columns(merged, ['mp_ancestor_id', 'mp_ancestor_label'])
+    assert dropped['gene_id'].tolist() == ['G1', 'G1']
@@ -0,0 +1,90 @@
+import os
+import sys
+
+# Tests import funcs/ from the scripts folder, like the pipeline scripts
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import numpy as np
+import pandas as pd
+
+from funcs.phenotype_profiles import (build_profiles, count_hits, overlap, popcount, subtree_masks,
+                                      unpack_terms)
+
+# toy DAG (child -> parents), with enough extra leaves under F that profiles span two 64-bit words
+PARENTS = {'A': ['R'], 'B': ['R'], 'C': ['A'], 'D': ['A', 'B'], 'E': ['C', 'D'], 'F': ['B']}
+PARENTS.update({f'L{i:02d}': ['F'] for i in range(70)})
+
+def ancestor_sets():
+    '''
+    Ancestors of every term, including the term itself, by walking the parents.
+    '''
+    def ancestors(term):
+        found = {term}
+        for parent in PARENTS.get(term, []):
+            found |= ancestors(parent)
+        return found
+    terms = sorted(set(PARENTS) | {p for ps in PARENTS.values() for p in ps})
+    return {term: ancestors(term) for term in terms}
+
+def toy_index():
+    '''
+    Closure index of the toy DAG, laid out like ontology_index.build_closure_index.
+    '''
+    sets = ancestor_sets()
+    terms = np.array(sorted(sets))
+    code = {term: i for i, term in enumerate(terms)}
+    pairs = sorted((code[a], code[t]) for t, ancestors in sets.items() for a in ancestors if a != t)
+    return {'terms': terms, 'labels': terms.copy(),
+            'ancestor': np.array([a for a, _ in pairs], dtype=np.int32),
+            'descendant': np.array([d for _, d in pairs], dtype=np.int32),
+            'depth': np.ones(len(pairs), dtype=np.int16)}
+
+ANNOTATIONS = pd.DataFrame({'gene_id': ['G1', 'G1', 'G2', 'G2', 'G3', 'G3'],
+                            'mp_id': ['E', 'L05', 'C', 'L69', 'D', 'X']})
+
+def expected_profiles(close_ancestors):
+    sets = ancestor_sets()
+    profiles = {}
+    for gene, terms in ANNOTATIONS.groupby('gene_id')['mp_id']:
+        terms = [term for term in terms if term in sets]
+        profiles[gene] = set().union(*(sets[t] if close_ancestors else {t} for t in terms))
+    return profiles
+
+def test_popcount():
+    bits = np.random.default_rng(0).integers(0, 256, size=(5, 24), dtype=np.uint8)
+    assert popcount(bits).tolist() == np.unpackbits(bits, axis=1).sum(axis=1).tolist()
+    # rows that are not whole 64-bit words are counted byte by byte
+    assert popcount(bits[:, :13]).tolist() == np.unpackbits(bits[:, :13], axis=1).sum(axis=1).tolist()
+
+def test_profiles_round_trip():
+    index = toy_index()
+    for close_ancestors in (True, False):
+        profiles = build_profiles(index, ANNOTATIONS, 'gene_id', 'mp_id', close_ancestors=close_ancestors)
+        assert profiles['groups'].tolist() == ['G1', 'G2', 'G3']
+        assert profiles['bits'].shape[1] % 8 == 0
+        expected = expected_profiles(close_ancestors)
+        for row, gene in enumerate(profiles['groups']):
+            assert set(unpack_terms(profiles, row)) == expected[gene]
+
+def test_hits_and_overlap_match_sets():
+    index, sets = toy_index(), ancestor_sets()
+    profiles = build_profiles(index, ANNOTATIONS, 'gene_id', 'mp_id')
+    expected = expected_profiles(True)
+    genes = profiles['groups']
+
+    subtrees = ['A', ['C', 'F'], 'L05']
+    masks = subtree_masks(index, subtrees)
+    under = [{t for t, ancestors in sets.items() if set(np.atleast_1d(roots)) & ancestors} for roots in subtrees]
+    hits = count_hits(profiles, masks)
+    for i, gene in enumerate(genes):
+        assert hits[i].tolist() == [len(expected[gene] & terms) for terms in under]
+
+    shared = overlap(profiles, [0, 2])
+    jaccard = overlap(profiles, [0, 2], jaccard=True)
+    for i, query in enumerate(genes[[0, 2]]):
+        for j, other in enumerate(genes):
+            a, b = expected[query], expected[other]
+            assert shared[i, j] == len(a & b)
+            assert np.isclose(jaccard[i, j], len(a & b) / len(a | b))
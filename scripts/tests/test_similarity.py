@@ -0,0 +1,81 @@
+import os
+import sys
+
+# Tests import funcs/ from the scripts folder, like the pipeline scripts
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import numpy as np
+import pandas as pd
+
+from funcs.similarity import information_content, set_similarity, term_similarity
+
+# toy DAG (child -> parents): R is the root, E has two parents
+PARENTS = {'A': ['R'], 'B': ['R'], 'C': ['A'], 'D': ['A', 'B'], 'E': ['C', 'D'], 'F': ['B']}
+
+def ancestor_sets():
+    '''
+    Ancestors of every term, including the term itself, by walking the parents.
+    '''
+    def ancestors(term):
+        found = {term}
+        for parent in PARENTS.get(term, []):
+            found |= ancestors(parent)
+        return found
+    terms = sorted(set(PARENTS) | {p for ps in PARENTS.values() for p in ps})
+    return {term: ancestors(term) for term in terms}
+
+def toy_index():
+    '''
+    Closure index of the toy DAG, laid out like ontology_index.build_closure_index.
+    '''
+    sets = ancestor_sets()
+    terms = np.array(sorted(sets))
+    code = {term: i for i, term in enumerate(terms)}
+    pairs = sorted((code[a], code[t]) for t, ancestors in sets.items() for a in ancestors if a != t)
+    return {'terms': terms, 'labels': terms.copy(),
+            'ancestor': np.array([a for a, _ in pairs], dtype=np.int32),
+            'descendant': np.array([d for _, d in pairs], dtype=np.int32),
+            'depth': np.ones(len(pairs), dtype=np.int16)}
+
+def brute_resnik(sets, ic, code, a, b):
+    return max(ic[code[term]] for term in sets[a] & sets[b])
+
+def test_term_similarity_matches_ancestor_sets():
+    index, sets = toy_index(), ancestor_sets()
+    code = {term: i for i, term in enumerate(index['terms'])}
+    annotations = ['C', 'D', 'E', 'E', 'F', 'A']
+    ic = information_content(index, annotations=annotations)
+    terms = list(index['terms'])
+    for term in terms:
+        under = sum(term in sets[annotated] for annotated in annotations)
+        assert np.isclose(ic[code[term]], -np.log(under / len(annotations)))
+
+    resnik = term_similarity(index, ic, terms, terms, chunk_size=7)
+    lin = term_similarity(index, ic, terms, terms, method='lin')
+    for i, a in enumerate(terms):
+        for j, b in enumerate(terms):
+            expected = brute_resnik(sets, ic, code, a, b)
+            assert np.isclose(resnik[i, j], expected)
+            total = ic[code[a]] + ic[code[b]]
+            assert np.isclose(lin[i, j], 2 * expected / total if total > 0 else 0)
+
+    # terms missing from the index have similarity 0
+    assert not term_similarity(index, ic, ['X'], terms).any()
+
+def test_set_similarity_best_match_average():
+    index, sets = toy_index(), ancestor_sets()
+    code = {term: i for i, term in enumerate(index['terms'])}
+    ic = information_content(index)
+    query = pd.DataFrame({'gene_id': ['G1', 'G1', 'G2'], 'term': ['C', 'F', 'E']})
+    target = pd.DataFrame({'system': ['S1', 'S1', 'S2'], 'term': ['D', 'A', 'B']})
+
+    bma = set_similarity(index, query, target, 'gene_id', 'system').set_index(['gene_id', 'system'])['similarity']
+    best = set_similarity(index, query, target, 'gene_id', 'system', combine='max').set_index(['gene_id', 'system'])['similarity']
+    for (gene, system), score in bma.items():
+        q = query.loc[query['gene_id'] == gene, 'term']
+        t = target.loc[target['system'] == system, 'term']
+        sim = np.array([[brute_resnik(sets, ic, code, a, b) for b in t] for a in q])
+        assert np.isclose(score, 0.5 * (sim.max(axis=1).mean() + sim.max(axis=0).mean()))
+        assert np.isclose(best[(gene, system)], sim.max())
@@ -0,0 +1,189 @@
+import argparse
+import concurrent.futures
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import average_precision_score, roc_auc_score
+from sklearn.model_selection import GroupKFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from funcs.data import read_table, write_table
+from funcs.profiling import export_profile, logger, profiled, setup_logging
+
+# rwr_score and network_seed are left out by default: the network propagation seeds are
+# the ClinGen case genes themselves, so those features would leak the label
+FEATURES = ['l2g_max_score', 'gwas_loci', 'mouse_phenotypes', 'mouse_phenotype_terms', 'mouse_similarity']
+MODEL_DIR = 'data/models'
+POOLED = 'pooled'
+
+MODELS = {
+    'logistic': lambda seed: make_pipeline(StandardScaler(), LogisticRegression(class_weight='balanced', max_iter=1000)),
+    'gradient_boosting': lambda seed: HistGradientBoostingClassifier(class_weight='balanced', random_state=seed),
+}
+
+def write_training_arrays(matrix, features=FEATURES, folder=MODEL_DIR):
+    '''
+    Save the feature matrix as .npy arrays that worker processes memory map instead of
+    receiving a copy: features (float32, cells x features), label (int8), gene and
+    ancestor codes (int32). Returns the ancestor IDs, indexed by ancestor code.
+    '''
+    os.makedirs(folder, exist_ok=True)
+    X = np.lib.format.open_memmap(os.path.join(folder, 'features.npy'), mode='w+', dtype=np.float32,
+                                  shape=(len(matrix), len(features)))
+    for i, feature in enumerate(features):
+        X[:, i] = matrix[feature].to_numpy(np.float32)
+    X.flush()
+    del X
+
+    np.save(os.path.join(folder, 'label.npy'), matrix['clingen_label'].to_numpy(np.int8))
+    np.save(os.path.join(folder, 'gene.npy'), matrix['gene_id'].cat.codes.to_numpy(np.int32))
+    np.save(os.path.join(folder, 'ancestor.npy'), matrix['mondo_ancestor_id'].cat.codes.to_numpy(np.int32))
+    return matrix['mondo_ancestor_id'].cat.categories
+
+def load_training_arrays(folder=MODEL_DIR):
+    return {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r')
+            for name in ['features', 'label', 'gene', 'ancestor']}
+
+def _training_rows(arrays, ancestor):
+    '''
+    Labelled rows for one organ system (ancestor code), or for all of them if ancestor is None.
+    '''
+    labelled = np.asarray(arrays['label']) >= 0
+    if ancestor is not None:
+        labelled &= np.asarray(arrays['ancestor']) == ancestor
+    return np.flatnonzero(labelled)
+
+def fit_fold(folder, ancestor, fold, n_splits, model, seed):
+    '''
+    Fit one cross-validation fold and score its held-out genes.
+
+    Folds are grouped by gene so all rows of a gene (in the pooled model, one per
+    organ system) are either in training or in testing.
+    '''
+    arrays = load_training_arrays(folder)
+    rows = _training_rows(arrays, ancestor)
+    y = np.asarray(arrays['label'][rows])
+    groups = np.asarray(arrays['gene'][rows])
+    result = {'ancestor': ancestor, 'fold': fold, 'n_train': 0, 'n_test': 0, 'auc': np.nan, 'average_precision': np.nan,
+              'rows': np.array([], dtype=np.int64), 'scores': np.array([], dtype=np.float32)}
+
+    if len(np.unique(groups)) < n_splits:
+        return result
+    train, test = list(GroupKFold(n_splits=n_splits).split(rows, y, groups))[fold]
+    result.update(n_train=len(train), n_test=len(test))
+    if len(np.unique(y[train])) < 2:
+        return result
+
+    X = arrays['features']
+    classifier = MODELS[model](seed).fit(X[rows[train]], y[train])
+    scores = classifier.predict_proba(X[rows[test]])[:, 1].astype(np.float32)
+    result.update(rows=rows[test], scores=scores)
+    if len(np.unique(y[test])) == 2:
+        result.update(auc=roc_auc_score(y[test], scores), average_precision=average_precision_score(y[test], scores))
+    return result
+
+def fit_final(folder, ancestor, model, seed):
+    '''
+    Fit a model on every labelled row of an organ system (or all of them for the pooled
+    model) and score every gene for it. Returns (ancestor, fitted model, scored rows, scores).
+    '''
+    arrays = load_training_arrays(folder)
+    rows = _training_rows(arrays, ancestor)
+    y = np.asarray(arrays['label'][rows])
+    if len(np.unique(y)) < 2:
+        return ancestor, None, np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+    X = arrays['features']
+    classifier = MODELS[model](seed).fit(X[rows], y)
+    scored = np.arange(len(arrays['label'])) if ancestor is None else np.flatnonzero(np.asarray(arrays['ancestor']) == ancestor)
+    return ancestor, classifier, scored, classifier.predict_proba(X[scored])[:, 1].astype(np.float32)
+
+@profiled
+def train_models(matrix, features=FEATURES, n_splits=5, model='logistic', folder=MODEL_DIR, max_workers=None, seed=0):
+    '''
+    Fit one classifier per mondo_ancestor_id and a pooled classifier over all of them.
+
+    Every (model, fold) cross-validation fit and every final fit is an independent task in
+    a process pool; workers memory map the feature arrays written by write_training_arrays,
+    so adding cores scales the ~20 organ-system models near linearly.
+
+    Returns (cross-validation metrics per model and fold, scores for every cell, fitted
+    models keyed by ancestor ID or 'pooled').
+    '''
+    ancestors = write_training_arrays(matrix, features=features, folder=folder)
+    codes = list(range(len(ancestors))) + [None]
+    name = lambda code: POOLED if code is None else ancestors[code]
+
+    metrics, models = [], {}
+    out_of_fold = np.full(len(matrix), np.nan, dtype=np.float32)
+    organ_score = np.full(len(matrix), np.nan, dtype=np.float32)
+    pooled_score = np.full(len(matrix), np.nan, dtype=np.float32)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        folds = [pool.submit(fit_fold, folder, code, fold, n_splits, model, seed) for code in codes for fold in range(n_splits)]
+        finals = [pool.submit(fit_final, folder, code, model, seed) for code in codes]
+
+        for future in concurrent.futures.as_completed(folds):
+            result = future.result()
+            if result['ancestor'] is not None:
+                out_of_fold[result['rows']] = result['scores']
+            metrics.append({'model': name(result['ancestor']), 'fold': result['fold'], 'n_train': result['n_train'],
+                            'n_test': result['n_test'], 'auc': result['auc'], 'average_precision': result['average_precision']})
+
+        for future in concurrent.futures.as_completed(finals):
+            code, classifier, rows, scores = future.result()
+            if classifier is None:
+                logger.warning("Not enough labelled genes to fit a model for %s", name(code))
+                continue
+            models[name(code)] = classifier
+            if code is None:
+                pooled_score[rows] = scores
+            else:
+                organ_score[rows] = scores
+
+    metrics = pd.DataFrame(metrics).sort_values(['model', 'fold'], ignore_index=True)
+    scores = pd.DataFrame({'gene_id': matrix['gene_id'], 'gene_name': matrix['gene_name'],
+                           'mondo_ancestor_id': matrix['mondo_ancestor_id'], 'clingen_label': matrix['clingen_label'],
+                           'organ_model_score': organ_score, 'pooled_model_score': pooled_score,
+                           'cross_validation_score': out_of_fold})
+    return metrics, scores, models
+
+def save_models(models, features, model, folder=MODEL_DIR):
+    '''
+    Pickle the fitted models with the feature names they expect.
+    '''
+    with open(os.path.join(folder, f'{model}.models.pkl'), 'wb') as f:
+        pickle.dump({'features': list(features), 'model': model, 'models': models}, f)
+
+def load_models(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train organ-system and pooled gene prioritisation models. Run from the repository root.')
+    parser.add_argument('--model', choices=sorted(MODELS), default='logistic')
+    parser.add_argument('--folds', type=int, default=5, help='number of gene-grouped cross-validation folds')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--features', nargs='+', default=FEATURES, help='feature matrix columns to train on')
+    args = parser.parse_args(argv)
+
+    matrix = read_table('data/features/feature_matrix')
+    metrics, scores, models = train_models(matrix, features=args.features, n_splits=args.folds, model=args.model, max_workers=args.workers)
+
+    summary = metrics.groupby('model')[['auc', 'average_precision']].mean()
+    print(summary.to_string())
+
+    metrics.to_csv(os.path.join(MODEL_DIR, f'{args.model}.cv_metrics.txt'), sep='\t', index=False)
+    save_models(models, args.features, args.model)
+    write_table(scores, os.path.join(MODEL_DIR, f'{args.model}.scores'))
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+    export_profile('data/profiles/train_models.json')